@@ -0,0 +1,190 @@
+# analytics.py
+# Server-computed profit and margin, and the product_summary table behind
+# GET /products/analytics.
+#
+# product_summary holds running totals per vendor, product type, status and
+# collection. The crud write paths turn every change into a delta (the old
+# state of the touched products subtracted, the new state added) and apply
+# it in the same transaction, so dashboards read a few hundred rows instead
+# of aggregating the products table. crud.rebuild_product_summary recomputes
+# it from scratch and crud.check_product_summary compares the two.
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Float, and_, case, func, literal, null, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import QueryableAttribute
+from sqlalchemy.sql.expression import ColumnElement
+
+import models
+from facets import split_values
+
+# Dimension -> Product column; collections are comma-separated, so a product
+# counts towards each of its collections.
+DIMENSIONS = {
+    "vendor": "vendor",
+    "product_type": "product_type",
+    "status": "status",
+    "collection": "collections",
+}
+# product_summary columns holding running totals, in this order everywhere.
+MEASURES = ("products", "priced", "margin_total", "inventory", "stock_value")
+# Writes touching none of these leave the summary unchanged.
+SUMMARY_COLUMNS = frozenset(DIMENSIONS.values()) | {"price", "cost_per_item", "inventory_quantity"}
+FINANCIAL_INPUTS = frozenset({"price", "cost_per_item"})
+# Columns read to compute a product's contribution (see snapshot()).
+SNAPSHOT_COLUMNS = ("id",) + tuple(DIMENSIONS.values()) + ("cost_per_item", "margin", "inventory_quantity")
+
+
+def financials(price: Optional[float], cost: Optional[float]) -> dict:
+    """``profit`` (price - cost) and ``margin`` (profit as a percentage of price)."""
+    if price is None or cost is None:
+        return {"profit": None, "margin": None}
+    profit = price - cost
+    return {"profit": profit, "margin": profit * 100 / price if price else None}
+
+
+def with_financials(values: dict) -> dict:
+    """``values`` (a full product) with profit and margin recomputed."""
+    return dict(values, **financials(values.get("price"), values.get("cost_per_item")))
+
+
+def financial_expressions(price, cost) -> dict:
+    """SQL counterpart of financials() for UPDATE statements.
+
+    ``price`` and ``cost`` are new values or column expressions; the
+    arithmetic is the same as in Python so stored values do not depend on
+    which path wrote them.
+    """
+    price, cost = (
+        value if isinstance(value, (ColumnElement, QueryableAttribute)) else literal(value, Float)
+        for value in (price, cost)
+    )
+    profit = case((and_(price.isnot(None), cost.isnot(None)), price - cost), else_=null())
+    margin = case(
+        (and_(price.isnot(None), cost.isnot(None), price != 0), (price - cost) * 100 / price),
+        else_=null(),
+    )
+    return {"profit": profit, "margin": margin}
+
+
+def snapshot(product) -> dict:
+    """The values of ``product`` (an ORM object or a mapping) that feed the summary."""
+    get = product.get if isinstance(product, dict) else lambda key: getattr(product, key)
+    return {column: get(column) for column in SNAPSHOT_COLUMNS}
+
+
+def contributions(product) -> Dict[Tuple[str, str], Tuple]:
+    """``(dimension, value) -> measures`` added by one product."""
+    values = snapshot(product)
+    quantity, cost, margin = values["inventory_quantity"], values["cost_per_item"], values["margin"]
+    measures = (
+        1,
+        int(margin is not None),
+        margin or 0.0,
+        quantity or 0,
+        quantity * cost if quantity is not None and cost is not None else 0.0,
+    )
+    keys = []
+    for dimension, column in DIMENSIONS.items():
+        raw = values[column]
+        for value in (split_values(raw) if dimension == "collection" else [raw] if raw is not None else []):
+            keys.append((dimension, value))
+    return {key: measures for key in keys}
+
+
+def summary_delta(before: Iterable, after: Iterable) -> List[dict]:
+    """product_summary increments turning ``before`` into ``after``.
+
+    Both are products (ORM objects or mappings); keys whose totals do not
+    change are left out. Rows come sorted so concurrent writers lock them in
+    the same order.
+    """
+    totals = defaultdict(lambda: [0] * len(MEASURES))
+    for sign, products in ((-1, before), (1, after)):
+        for product in products:
+            for key, measures in contributions(product).items():
+                total = totals[key]
+                for i, measure in enumerate(measures):
+                    total[i] += sign * measure
+    return [
+        dict(zip(("dimension", "value") + MEASURES, key + tuple(total)))
+        for key, total in sorted(totals.items())
+        if any(total)
+    ]
+
+
+def upsert_statement(dialect_name: str):
+    """INSERT ... ON CONFLICT adding the excluded row's measures to the totals."""
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = insert(models.ProductSummary)
+    return stmt.on_conflict_do_update(
+        index_elements=["dimension", "value"],
+        set_={measure: getattr(models.ProductSummary, measure) + stmt.excluded[measure] for measure in MEASURES},
+    )
+
+
+def aggregate_statements():
+    """``(dimension, value, *MEASURES)`` computed from the products table.
+
+    Collections come from the product_facets junction table, which holds the
+    same split values.
+    """
+    product = models.Product
+    measures = [
+        func.count(product.id),
+        func.count(product.margin),
+        func.coalesce(func.sum(product.margin), 0.0),
+        func.coalesce(func.sum(product.inventory_quantity), 0),
+        func.coalesce(func.sum(product.inventory_quantity * product.cost_per_item), 0.0),
+    ]
+    statements = []
+    for dimension, column in DIMENSIONS.items():
+        if dimension == "collection":
+            value = models.ProductFacet.value
+            stmt = (
+                select(literal(dimension), value, *measures)
+                .join(models.ProductFacet, models.ProductFacet.product_id == product.id)
+                .where(models.ProductFacet.facet == "collection")
+            )
+        else:
+            value = getattr(product, column)
+            stmt = select(literal(dimension), value, *measures).where(value.isnot(None))
+        statements.append(stmt.group_by(value))
+    return statements
+
+
+def compare(stored: Iterable, expected: Iterable) -> List[dict]:
+    """Differences between two sets of summary rows; empty totals count as absent."""
+    def by_key(rows):
+        return {(row[0], row[1]): tuple(row[2:]) for row in rows if row[2]}
+
+    stored, expected = by_key(stored), by_key(expected)
+    zero = (0,) * len(MEASURES)
+    problems = []
+    for key in sorted(stored.keys() | expected.keys()):
+        have, want = stored.get(key, zero), expected.get(key, zero)
+        for measure, a, b in zip(MEASURES, have, want):
+            # Float totals pick up rounding error from repeated +/-.
+            if not math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6):
+                problems.append({"dimension": key[0], "value": key[1], "measure": measure, "stored": a, "expected": b})
+    return problems
+
+
+def present(rows: Iterable) -> Dict[str, List[dict]]:
+    """API shape: per dimension, values with their totals, most products first."""
+    result = defaultdict(list)
+    for row in rows:
+        if not row.products:
+            continue
+        result[row.dimension].append({
+            "value": row.value,
+            "products": row.products,
+            "average_margin": row.margin_total / row.priced if row.priced else None,
+            "inventory": row.inventory,
+            "stock_value": row.stock_value,
+        })
+    for values in result.values():
+        values.sort(key=lambda item: (-item["products"], item["value"]))
+    return dict(result)
@@ -0,0 +1,188 @@
+# async_crud.py
+# AsyncSession counterparts of the functions in crud.py, plus run_crud() which
+# lets the endpoints call either flavour without caring about DB_MODE.
+from typing import List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
+
+import crud
+import models, schemas
+import pagination
+import facets
+import search
+import changefeed
+import analytics
+from analytics import SUMMARY_COLUMNS
+from facets import FACET_COLUMNS
+from config import SEARCH_BACKEND
+
+
+async def run_crud(db, fn, *args, **kwargs):
+    """Call the crud function ``fn`` with the request's session.
+
+    With a sync Session the blocking call is moved to the threadpool. With an
+    AsyncSession the counterpart registered in ASYNC_CRUD is awaited;
+    functions that do not have one yet run through ``AsyncSession.run_sync``,
+    which drives the sync code on the async connection without blocking the
+    event loop.
+    """
+    if not isinstance(db, AsyncSession):
+        return await run_in_threadpool(fn, db, *args, **kwargs)
+    async_fn = ASYNC_CRUD.get(fn)
+    if async_fn is not None:
+        return await async_fn(db, *args, **kwargs)
+    return await db.run_sync(fn, *args, **kwargs)
+
+
+async def create_user(db: AsyncSession, name: str, email: str, hashed_password: str):
+    db_user = models.User(name=name, email=email, hashed_password=hashed_password)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+async def get_user_credentials(db: AsyncSession, email: str):
+    result = await db.execute(
+        select(models.User.id, models.User.hashed_password).filter(models.User.email == email)
+    )
+    row = result.first()
+    await db.rollback()
+    return tuple(row) if row else None
+
+async def update_user_password_hash(db: AsyncSession, user_id: int, hashed_password: str):
+    await db.execute(
+        update(models.User).where(models.User.id == user_id).values(hashed_password=hashed_password)
+    )
+    await db.commit()
+
+async def create_product(db: AsyncSession, product: schemas.ProductCreate):
+    db_product = models.Product(**analytics.with_financials(product.dict()))
+    db.add(db_product)
+    await db.flush()
+    await db.run_sync(crud.sync_product_facets, [db_product])
+    await db.run_sync(crud.record_summary, [], [db_product])
+    await db.commit()
+    await db.refresh(db_product)
+    crud.products_changed([db_product], changefeed.CREATED)
+    return db_product
+
+async def get_product(db: AsyncSession, product_id: int):
+    return await db.get(models.Product, product_id)
+
+async def _fetch(db: AsyncSession, stmt, columns):
+    result = await db.execute(stmt)
+    return result.all() if columns else result.scalars().all()
+
+async def get_products(db: AsyncSession, skip: int = 0, limit: int = 10, sort: str = "id", filters: Optional[dict] = None, columns=None):
+    stmt = (
+        (select(*columns) if columns else select(models.Product))
+        .filter(*facets.filter_clauses(**(filters or {})))
+        .order_by(*pagination.order_by(sort))
+        .offset(skip)
+        .limit(limit)
+    )
+    return await _fetch(db, stmt, columns)
+
+async def get_products_page(db: AsyncSession, limit: int = 10, cursor: Optional[str] = None, sort: str = "id", filters: Optional[dict] = None, columns=None):
+    rows = []
+    clauses = facets.filter_clauses(**(filters or {}))
+    for seek in pagination.seek_filters(sort, cursor):
+        stmt = (select(*columns) if columns else select(models.Product)).filter(*clauses)
+        if seek is not None:
+            stmt = stmt.filter(seek)
+        stmt = stmt.order_by(*pagination.order_by(sort)).limit(limit + 1 - len(rows))
+        rows += await _fetch(db, stmt, columns)
+        if len(rows) > limit:
+            break
+    return pagination.split_page(rows, limit, sort)
+
+async def search_products(db: AsyncSession, q: str, limit: int = 20):
+    if SEARCH_BACKEND != "postgres":
+        return await db.run_sync(crud.search_products, q, limit)
+    if search.tsquery_text(q) is None:
+        return []
+    return (await db.scalars(crud.search_statement(q, limit))).all()
+
+async def update_product(db: AsyncSession, product_id: int, product: schemas.ProductCreate):
+    db_product = await db.get(models.Product, product_id)
+    if db_product:
+        before = analytics.snapshot(db_product)
+        for key, value in analytics.with_financials(product.dict()).items():
+            setattr(db_product, key, value)
+        await db.run_sync(crud.sync_product_facets, [db_product])
+        await db.run_sync(crud.record_summary, [before], [db_product])
+        try:
+            await db.commit()
+        except StaleDataError:
+            await db.rollback()
+            raise crud.StaleProduct(product_id)
+        await db.refresh(db_product)
+        crud.products_changed([db_product])
+    return db_product
+
+async def patch_product(db: AsyncSession, product_id: int, values: dict, expected_version: Optional[int] = None):
+    before = None
+    if SUMMARY_COLUMNS.intersection(values):
+        before = await db.run_sync(crud.summary_snapshot, [product_id])
+    db_product = (await db.scalars(crud.patch_statement(product_id, values, expected_version))).first()
+    if db_product is None:
+        await db.rollback()
+        if expected_version is not None and await db.get(models.Product, product_id) is not None:
+            raise crud.StaleProduct(product_id)
+        return None
+    if FACET_COLUMNS.intersection(values):
+        await db.run_sync(crud.sync_product_facets, [db_product])
+    if before is not None:
+        await db.run_sync(crud.record_summary, before, [db_product])
+    await db.commit()
+    crud.products_changed([db_product])
+    return db_product
+
+async def batch_patch_products(db: AsyncSession, updates: List[dict]):
+    before = None
+    if any(SUMMARY_COLUMNS.intersection(item) for item in updates):
+        before = await db.run_sync(crud.summary_snapshot, [item["id"] for item in updates])
+    products = (await db.scalars(crud.batch_patch_statement(updates))).all()
+    updated = {product.id for product in products}
+    if any(FACET_COLUMNS.intersection(item) for item in updates):
+        await db.run_sync(crud.sync_product_facets, products)
+    if before is not None:
+        await db.run_sync(crud.record_summary, [row for row in before if row["id"] in updated], products)
+    await db.commit()
+    crud.products_changed(products)
+    return products, [item["id"] for item in updates if item["id"] not in updated]
+
+async def delete_product(db: AsyncSession, product_id: int):
+    db_product = await db.get(models.Product, product_id)
+    if db_product:
+        await db.execute(delete(models.ProductFacet).where(models.ProductFacet.product_id == product_id))
+        await db.run_sync(crud.record_summary, [db_product], [])
+        await db.delete(db_product)
+        try:
+            await db.commit()
+        except StaleDataError:
+            await db.rollback()
+            raise crud.StaleProduct(product_id)
+        crud.product_removed(product_id)
+    return db_product
+
+
+# crud function -> its AsyncSession counterpart, used by run_crud(). Keyed by
+# the function itself, so only the pairs listed here are ever swapped.
+ASYNC_CRUD = {
+    crud.create_user: create_user,
+    crud.get_user_credentials: get_user_credentials,
+    crud.update_user_password_hash: update_user_password_hash,
+    crud.create_product: create_product,
+    crud.get_product: get_product,
+    crud.get_products: get_products,
+    crud.get_products_page: get_products_page,
+    crud.search_products: search_products,
+    crud.update_product: update_product,
+    crud.patch_product: patch_product,
+    crud.batch_patch_products: batch_patch_products,
+    crud.delete_product: delete_product,
+}
@@ -0,0 +1,68 @@
+"""Catalog analytics: summary table vs. aggregating products on every request.
+
+    python benchmarks/bench_analytics.py --rows 200000 --repeat 50
+
+Reads: crud.get_product_summary (product_summary, a few rows per value)
+against the same totals computed by analytics.aggregate_statements() over
+the whole products table, which is what a dashboard had to run before.
+
+Writes: the price of keeping the summary current, as PATCH-style updates
+that touch a summary column (vendor, price) next to ones that do not
+(title).
+"""
+import argparse
+import json
+import random
+
+from common import VENDORS, seed_products, sqlite_session_factory, summarize, timed
+
+import analytics
+import crud
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--writes", type=int, default=500)
+    parser.add_argument("--db", default=":memory:", help="SQLite file (default: in-memory)")
+    args = parser.parse_args()
+
+    _, session_factory = sqlite_session_factory(args.db)
+    seed_products(session_factory, args.rows)
+    with session_factory() as db:
+        crud.rebuild_product_facets(db)
+        rebuild_seconds, summary_rows = timed(crud.rebuild_product_summary, db)
+
+    reads = {"summary_table": [], "full_aggregate": []}
+    with session_factory() as db:
+        for _ in range(args.repeat):
+            reads["summary_table"].append(timed(crud.get_product_summary, db)[0])
+            reads["full_aggregate"].append(
+                timed(lambda: [db.execute(stmt).all() for stmt in analytics.aggregate_statements()])[0]
+            )
+            db.rollback()
+
+    rng = random.Random(7)
+    writes = {"title_only": [], "vendor_and_price": []}
+    with session_factory() as db:
+        for _ in range(args.writes):
+            product_id = rng.randint(1, args.rows)
+            writes["title_only"].append(timed(crud.patch_product, db, product_id, {"title": f"T{product_id}"})[0])
+            product_id = rng.randint(1, args.rows)
+            values = {"vendor": rng.choice(VENDORS), "price": round(rng.uniform(1, 500), 2)}
+            writes["vendor_and_price"].append(timed(crud.patch_product, db, product_id, values)[0])
+        problems = crud.check_product_summary(db)
+
+    print(json.dumps({
+        "rows": args.rows,
+        "summary_rows": summary_rows,
+        "rebuild_seconds": round(rebuild_seconds, 3),
+        "reads": {name: summarize(samples) for name, samples in reads.items()},
+        "writes": {name: summarize(samples) for name, samples in writes.items()},
+        "consistent_after_writes": not problems,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Authenticated request throughput: bearer token vs. re-checking the password.
+
+    python benchmarks/bench_auth.py --duration 5 --concurrency 16 --rounds 12
+
+Two otherwise empty routes are mounted on the in-process app:
+
+* /bench/token checks the Authorization header with main.require_user
+  (signature, expiry and revocation, all local)
+* /bench/credentials does what every request had to do before tokens: look
+  the user up and bcrypt-verify the password sent along with it
+
+A real protected endpoint (PATCH /products/{id}) is measured with the token
+as well, to show the check next to actual work.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from common import asgi_client, load_app, seed_products, summarize
+
+EMAIL, PASSWORD = "bench@example.com", "secret"
+
+
+def mount_routes(main):
+    from fastapi import Depends, Header, HTTPException
+
+    import crud
+    import passwords
+    from async_crud import run_crud
+
+    @main.app.get("/bench/token", dependencies=[Depends(main.require_user)])
+    async def token_route():
+        return {}
+
+    @main.app.get("/bench/credentials")
+    async def credentials_route(
+        x_email: str = Header(...), x_password: str = Header(...), db=Depends(main.get_db)
+    ):
+        credentials = await run_crud(db, crud.get_user_credentials, x_email)
+        if not credentials or not (await passwords.verify_password(x_password, credentials[1]))[0]:
+            raise HTTPException(status_code=401)
+        return {}
+
+
+async def run_phase(client, method: str, path: str, headers: dict, concurrency: int, duration: float, **kwargs):
+    samples, statuses = [], {}
+    # One shared deadline: with the in-process transport a worker may not
+    # yield to the others until its request needs real I/O.
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.request(method, path, headers=headers, **kwargs)
+            samples.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"requests_per_s": round(len(samples) / elapsed, 1), "statuses": statuses, "latency": summarize(samples)}
+
+
+async def run(args):
+    main = load_app(
+        os.path.join(tempfile.mkdtemp(), "bench.db"),
+        BCRYPT_ROUNDS=args.rounds,
+        ACCESS_LOG_SAMPLE_RATE=0,
+        PASSWORD_HASH_QUEUE_LIMIT=max(args.concurrency, 32),
+    )
+    import database
+
+    seed_products(database.SessionLocal, 100)
+    mount_routes(main)
+    async with asgi_client(main.app) as client:
+        await client.post("/register", json={"name": "bench", "email": EMAIL, "password": PASSWORD})
+        login = (await client.post("/login", json={"email": EMAIL, "password": PASSWORD})).json()
+        bearer = {"Authorization": f"Bearer {login['access_token']}"}
+        results = {
+            "token": await run_phase(client, "GET", "/bench/token", bearer, args.concurrency, args.duration),
+            "password_each_call": await run_phase(
+                client, "GET", "/bench/credentials", {"X-Email": EMAIL, "X-Password": PASSWORD},
+                args.concurrency, args.duration,
+            ),
+            "patch_with_token": await run_phase(
+                client, "PATCH", "/products/1", bearer, args.concurrency, args.duration, json={"status": "active"},
+            ),
+        }
+    return {"bcrypt_rounds": args.rounds, "concurrency": args.concurrency, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per phase")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
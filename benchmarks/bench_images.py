@@ -0,0 +1,112 @@
+"""Throughput of the built-in /images route.
+
+    python benchmarks/bench_images.py --files 200 --size 65536 --concurrency 32
+    python benchmarks/bench_images.py --url http://127.0.0.1:8000 --dir uploads/images
+
+By default a directory of sample images is generated and served in-process
+over httpx's ASGI transport. With --url the requests go to a running server
+instead (e.g. uvicorn, to include its socket and sendfile path), and --dir
+must point at that server's UPLOAD_DIR so the sample files can be listed.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+
+from common import asgi_client, load_app, summarize
+
+
+def make_samples(directory: str, files: int, size: int, seed: int = 7):
+    rng = random.Random(seed)
+    urls = []
+    for _ in range(files):
+        data = rng.randbytes(size)
+        name = hashlib.sha256(data).hexdigest()
+        target = os.path.join(directory, name[:2], name[2:4])
+        os.makedirs(target, exist_ok=True)
+        with open(os.path.join(target, f"{name}.png"), "wb") as out:
+            out.write(data)
+        urls.append(f"/images/{name[:2]}/{name[2:4]}/{name}.png")
+    return urls
+
+
+def list_samples(directory: str):
+    urls = []
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            relative = os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/")
+            urls.append("/images/" + relative)
+    return urls
+
+
+async def run_phase(client, urls, concurrency: int, requests: int, headers: dict):
+    samples, transferred = [], 0
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(urls[i % len(urls)])
+
+    async def worker():
+        nonlocal transferred
+        while not queue.empty():
+            url = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            samples.append(time.perf_counter() - start)
+            assert response.status_code in (200, 206, 304), response.status_code
+            transferred += len(response.content)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests_per_s": requests / elapsed,
+        "mb_per_s": transferred / elapsed / 1e6,
+        "latency": summarize(samples),
+    }
+
+
+async def run(args):
+    if args.url:
+        import httpx
+
+        urls = list_samples(args.dir)
+        client = httpx.AsyncClient(base_url=args.url, limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        directory = tempfile.mkdtemp()
+        urls = make_samples(directory, args.files, args.size)
+        main = load_app(os.path.join(directory, ".bench.db"), UPLOAD_DIR=directory)
+        client = asgi_client(main.app)
+    if not urls:
+        raise SystemExit("no images found")
+
+    async with client:
+        phases = {
+            "full": {},
+            "range_first_4k": {"Range": "bytes=0-4095"},
+        }
+        results = {name: await run_phase(client, urls, args.concurrency, args.requests, headers)
+                   for name, headers in phases.items()}
+        etag = (await client.get(urls[0])).headers["etag"]
+        results["not_modified"] = await run_phase(client, urls[:1], args.concurrency, args.requests, {"If-None-Match": etag})
+    return {"files": len(urls), "size": args.size, "concurrency": args.concurrency, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size", type=int, default=64 * 1024, help="bytes per generated image")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--dir", default="uploads/images", help="image directory of the server at --url")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Throughput of GET /products/ at limit=10/100/1000.
+
+    python benchmarks/bench_list.py --rows 5000 --requests 300
+
+Compares three ways of serving the same page, in-process over httpx's ASGI
+transport:
+
+* orm_validated: ORM objects re-validated through response_model and
+  encoded with the standard JSON encoder (the list endpoint before the fast
+  path; mounted here as /bench/legacy-products)
+* rows_orjson: the current endpoint, all fields
+* sparse_orjson: the current endpoint with ?fields=id,title,price
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import List, Optional
+
+from common import asgi_client, load_app, seed_products, summarize
+
+SPARSE_FIELDS = "id,title,price"
+
+
+def mount_legacy_route(main):
+    from fastapi import Depends
+    from fastapi.responses import JSONResponse
+
+    import crud
+    import schemas
+    from async_crud import run_crud
+
+    @main.app.get("/bench/legacy-products", response_model=List[schemas.Product], response_class=JSONResponse)
+    async def legacy_products(
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        sort: str = "id",
+        filters: dict = Depends(main.product_filters),
+        db=Depends(main.get_read_db),
+    ):
+        products, _ = await run_crud(db, crud.get_products_page, limit=limit, cursor=cursor, sort=sort, filters=filters)
+        return products
+
+
+async def run_phase(client, path: str, params: dict, concurrency: int, requests: int):
+    samples, transferred = [], 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, transferred
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await client.get(path, params=params)
+            samples.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+            transferred += len(response.content)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests_per_s": round(requests / elapsed, 1),
+        "bytes_per_response": transferred // requests,
+        "latency": summarize(samples),
+    }
+
+
+async def run(args):
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, "bench.db")
+    main = load_app(db_path, ACCESS_LOG_SAMPLE_RATE=0, DB_MODE=args.db_mode)
+    import database
+
+    seed_products(database.SessionLocal, args.rows)
+    mount_legacy_route(main)
+
+    results = {}
+    async with asgi_client(main.app) as client:
+        for limit in args.limits:
+            phases = {
+                "orm_validated": ("/bench/legacy-products", {"limit": limit}),
+                "rows_orjson": ("/products/", {"limit": limit}),
+                "sparse_orjson": ("/products/", {"limit": limit, "fields": SPARSE_FIELDS}),
+            }
+            requests = max(args.requests * 10 // limit, 20) if args.scale else args.requests
+            results[f"limit={limit}"] = {
+                name: await run_phase(client, path, params, args.concurrency, requests)
+                for name, (path, params) in phases.items()
+            }
+    return {"rows": args.rows, "db_mode": args.db_mode, "concurrency": args.concurrency, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--limits", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=300, help="requests per phase")
+    parser.add_argument("--scale", action="store_true", help="scale requests down for larger pages")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--db-mode", choices=["sync", "async"], default="sync")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
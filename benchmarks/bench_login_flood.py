@@ -0,0 +1,91 @@
+"""Product-read latency while a flood of logins is running.
+
+    python benchmarks/bench_login_flood.py --flood 64 --readers 8
+
+Runs the app in-process over httpx's ASGI transport. Reads are measured once
+on an idle server and once while --flood clients log in back to back; with
+bcrypt on its own bounded pool the two should stay close, and excess logins
+are shed with 503 instead of queueing behind every other request.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from common import asgi_client, load_app, seed_products, summarize
+
+
+async def read_products(client, readers: int, duration: float):
+    samples = []
+
+    async def reader(worker: int):
+        product_id = worker + 1
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get(f"/products/{product_id}")
+            samples.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+
+    await asyncio.gather(*(reader(i) for i in range(readers)))
+    return samples
+
+
+async def login_flood(client, clients: int, stop: asyncio.Event, counts: dict):
+    async def login():
+        while not stop.is_set():
+            response = await client.post("/login", json={"email": "bench@example.com", "password": "secret"})
+            counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*(login() for _ in range(clients)))
+
+
+async def run(args):
+    main = load_app(
+        os.path.join(tempfile.mkdtemp(), "bench.db"),
+        BCRYPT_ROUNDS=args.rounds,
+        PASSWORD_HASH_WORKERS=args.hash_workers,
+        PASSWORD_HASH_QUEUE_LIMIT=args.queue_limit,
+    )
+    import database
+
+    seed_products(database.SessionLocal, 100)
+    async with asgi_client(main.app) as client:
+        await client.post("/register", json={"name": "bench", "email": "bench@example.com", "password": "secret"})
+
+        idle = await read_products(client, args.readers, args.duration)
+
+        stop, counts = asyncio.Event(), {}
+        flood = asyncio.create_task(login_flood(client, args.flood, stop, counts))
+        await asyncio.sleep(0.2)
+        loaded = await read_products(client, args.readers, args.duration)
+        stop.set()
+        await flood
+
+    return {
+        "bcrypt_rounds": args.rounds,
+        "hash_workers": args.hash_workers,
+        "queue_limit": args.queue_limit,
+        "flood_clients": args.flood,
+        "idle_reads": summarize(idle),
+        "reads_during_flood": summarize(loaded),
+        "login_status_counts": counts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flood", type=int, default=64, help="concurrent login clients")
+    parser.add_argument("--readers", type=int, default=8, help="concurrent product readers")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per phase")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost")
+    parser.add_argument("--hash-workers", type=int, default=2)
+    parser.add_argument("--queue-limit", type=int, default=32)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
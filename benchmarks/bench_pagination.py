@@ -0,0 +1,60 @@
+"""Compare OFFSET and keyset (cursor) pagination as the page number grows.
+
+    python benchmarks/bench_pagination.py --rows 200000 --limit 50
+
+OFFSET latency grows linearly with the page number because every skipped row
+is still read; keyset latency should stay flat.
+"""
+import argparse
+import json
+
+from common import seed_products, sqlite_session_factory, summarize, timed
+
+import crud
+import pagination
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--sort", default="id", help="id, title, price or status (prefix - for desc)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", default=":memory:", help="SQLite file (default: in-memory)")
+    args = parser.parse_args()
+
+    _, session_factory = sqlite_session_factory(args.db)
+    seed_products(session_factory, args.rows)
+
+    last_page = max(1, args.rows // args.limit)
+    pages = sorted(p for p in {1, 10, 100, 1000, last_page // 2, last_page} if 1 <= p <= last_page)
+    results = []
+    with session_factory() as db:
+        for page in pages:
+            skip = (page - 1) * args.limit
+            # Position a cursor on the row just before the requested page.
+            boundary = crud.get_products(db, skip=max(skip - 1, 0), limit=1, sort=args.sort)
+            key, _ = pagination.parse_sort(args.sort)
+            cursor = None
+            if skip and boundary:
+                cursor = pagination.encode_cursor(args.sort, getattr(boundary[0], key), boundary[0].id)
+
+            offset_samples, keyset_samples = [], []
+            for _ in range(args.repeat):
+                db.expunge_all()
+                elapsed, _ = timed(crud.get_products, db, skip=skip, limit=args.limit, sort=args.sort)
+                offset_samples.append(elapsed)
+                db.expunge_all()
+                elapsed, _ = timed(crud.get_products_page, db, limit=args.limit, cursor=cursor, sort=args.sort)
+                keyset_samples.append(elapsed)
+            results.append({
+                "page": page,
+                "offset": summarize(offset_samples),
+                "keyset": summarize(keyset_samples),
+            })
+
+    print(json.dumps({"rows": args.rows, "limit": args.limit, "sort": args.sort, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Search latency over a synthetic catalog.
+
+    python benchmarks/bench_search.py --rows 1000000
+    python benchmarks/bench_search.py --rows 1000000 --database-url postgresql://localhost/bench
+
+Without --database-url the in-process inverted index (search.InvertedIndex)
+is built straight from generated rows, so no database is involved. With a
+Postgres URL the products table is created, seeded and searched through the
+tsvector/GIN path (crud.search_products); the table should be empty first.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+
+from common import PRODUCT_TYPES, VENDORS, summarize, timed
+
+# Zipf-ish pseudo-word vocabulary: a few very common words, a long tail of
+# rare ones, so queries hit both short and long posting lists.
+SYLLABLES = [
+    "ka", "lo", "mi", "ra", "ten", "vo", "shi", "pel", "dor", "qua", "nex", "tri",
+    "bu", "sa", "zen", "fi", "gor", "hal", "ju", "mor", "pi", "ste", "wan", "yu",
+]
+
+
+def make_vocabulary(rng: random.Random, size: int):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+def catalog(rows: int, vocabulary, seed: int = 42):
+    rng = random.Random(seed)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    for product_id in range(1, rows + 1):
+        title = rng.choices(vocabulary, cum_weights=cum_weights, k=3)
+        yield {
+            "id": product_id,
+            "title": f"{rng.choice(PRODUCT_TYPES).title()} {' '.join(title)}",
+            "description": " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=12)) + f" by {rng.choice(VENDORS)}",
+            "sku": f"SKU-{product_id:08d}",
+            "tags": ",".join(rng.sample(["sale", "new", "wireless", "rgb", "eco"], 2)),
+            "price": round(rng.uniform(1, 500), 2),
+        }
+
+
+def make_queries(rng: random.Random, vocabulary, count: int):
+    queries = []
+    for _ in range(count):
+        kind = rng.random()
+        word = rng.choice(vocabulary)
+        if kind < 0.4:
+            queries.append(word)
+        elif kind < 0.7:
+            queries.append(word[: max(2, len(word) // 2)])  # typing in progress
+        else:
+            queries.append(f"{rng.choice(PRODUCT_TYPES)} {word[:3]}")
+    return queries
+
+
+def bench_memory(args, vocabulary, queries):
+    import search
+
+    index = search.InvertedIndex()
+    build_seconds, _ = timed(index.build, catalog(args.rows, vocabulary))
+    samples, hits = [], 0
+    for q in queries:
+        elapsed, ids = timed(index.search, q, args.limit)
+        samples.append(elapsed)
+        hits += bool(ids)
+    return build_seconds, samples, hits
+
+
+def bench_postgres(args, vocabulary, queries):
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["SEARCH_BACKEND"] = "postgres"
+    from sqlalchemy import insert
+
+    import crud
+    import models
+    from database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        batch = []
+        for row in catalog(args.rows, vocabulary):
+            batch.append({key: value for key, value in row.items() if key != "id"})
+            if len(batch) == 10_000:
+                db.execute(insert(models.Product), batch)
+                batch = []
+        if batch:
+            db.execute(insert(models.Product), batch)
+        db.commit()
+    build_seconds = time.perf_counter() - start
+
+    samples, hits = [], 0
+    with SessionLocal() as db:
+        for q in queries:
+            elapsed, products = timed(crud.search_products, db, q, args.limit)
+            samples.append(elapsed)
+            hits += bool(products)
+            db.expunge_all()
+    return build_seconds, samples, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--database-url", help="Postgres URL; default benchmarks the in-process index")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    queries = make_queries(rng, vocabulary, args.queries)
+    if args.database_url:
+        backend, (build_seconds, samples, hits) = "postgres", bench_postgres(args, vocabulary, queries)
+    else:
+        backend, (build_seconds, samples, hits) = "memory", bench_memory(args, vocabulary, queries)
+
+    print(json.dumps({
+        "backend": backend,
+        "rows": args.rows,
+        "build_seconds": round(build_seconds, 2),
+        "queries_with_results": hits,
+        "latency": summarize(samples),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Time from process start to the first successful request.
+
+    python benchmarks/bench_startup.py --rows 20000 --runs 3
+    python benchmarks/bench_startup.py --servers gunicorn --workers 4
+
+Each run starts a fresh server process against a throwaway SQLite database
+(migrated with `alembic upgrade head` and seeded once), polls
+GET /products/?limit=10 until it answers 200, then stops the server with
+SIGTERM. Reported per server:
+
+* ready_s: spawn to first 200 (imports, worker boot, lifespan warm-up)
+* first_requests: latency of the requests right after that, to show what
+  the warm-up saved the first clients
+* shutdown_s: SIGTERM to exit (graceful shutdown, pools disposed)
+
+--cold runs the same servers with the warm-up disabled for comparison.
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, free_port, seed_products, server_command, sqlite_session_factory, summarize
+
+PATH = "/products/?limit=10"
+
+
+def start_once(server: str, env: dict, args):
+    import httpx
+
+    port = free_port()
+    url = f"http://127.0.0.1:{port}{PATH}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        server_command(server, port, args.workers), cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=5.0) as client:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{server} exited with {process.returncode} before serving")
+                if time.perf_counter() - started > args.timeout:
+                    raise RuntimeError(f"{server} not ready after {args.timeout}s")
+                try:
+                    if client.get(url).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+            ready = time.perf_counter() - started
+
+            samples = []
+            for _ in range(args.first_requests):
+                start = time.perf_counter()
+                client.get(url).raise_for_status()
+                samples.append(time.perf_counter() - start)
+    finally:
+        stopping = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        shutdown = time.perf_counter() - stopping
+    return ready, samples, shutdown
+
+
+def run_server(server: str, env: dict, args):
+    ready, first, shutdown = [], [], []
+    for _ in range(args.runs):
+        ready_s, samples, shutdown_s = start_once(server, env, args)
+        ready.append(ready_s)
+        first += samples
+        shutdown.append(shutdown_s)
+    return {
+        "ready_s": {"median": round(statistics.median(ready), 3), "runs": [round(value, 3) for value in ready]},
+        "first_requests": summarize(first),
+        "shutdown_s": round(statistics.median(shutdown), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--servers", nargs="+", choices=["uvicorn", "gunicorn"], default=["uvicorn", "gunicorn"])
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--first-requests", type=int, default=20)
+    parser.add_argument("--cold", action="store_true", help="also run with the warm-up disabled")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", ACCESS_LOG_SAMPLE_RATE="0")
+    os.environ["DATABASE_URL"] = env["DATABASE_URL"]
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    migrate_seconds = time.perf_counter() - started
+    _, session_factory = sqlite_session_factory(db_path)
+    seed_products(session_factory, args.rows)
+
+    variants = {"warm": env}
+    if args.cold:
+        variants["cold"] = dict(env, WARMUP_CONNECTIONS="0", WARMUP_PRODUCTS="0", WARMUP_SEARCH_INDEX="0")
+    results = {
+        f"{server}/{variant}": run_server(server, variant_env, args)
+        for variant, variant_env in variants.items()
+        for server in args.servers
+    }
+    print(json.dumps({
+        "rows": args.rows,
+        "gunicorn_workers": args.workers,
+        "migrate_s": round(migrate_seconds, 3),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
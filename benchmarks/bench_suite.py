@@ -0,0 +1,339 @@
+"""Load test of the main API endpoints, with baseline comparison.
+
+    python benchmarks/bench_suite.py --rows 10000 --output results.json
+    python benchmarks/bench_suite.py --server uvicorn --concurrency 1 16 64
+    python benchmarks/bench_suite.py --database-url postgresql://localhost/bench --server gunicorn --workers 4
+    python benchmarks/bench_suite.py --baseline baseline.json --output results.json
+    python benchmarks/bench_suite.py --compare baseline.json results.json
+
+By default the app runs in-process over httpx's ASGI transport against a
+throwaway SQLite database. With --server the database is migrated with
+`alembic upgrade head` and the app is started as a real server, so sockets,
+HTTP parsing and worker processes are included. --database-url points it at
+a local Postgres instead; that database should be empty.
+
+The catalog is seeded with --rows products. Every scenario then runs
+--requests requests at each --concurrency level, in this order:
+
+* list: GET /products/?limit=20
+* get: GET /products/{id}
+* create / create_image: POST /products/ without / with an image upload
+* update: PATCH /products/{id}
+* delete: DELETE /products/{id}, for the products created in this round
+* register / login: POST /register, POST /login (--auth-requests each;
+  bcrypt dominates these, see --bcrypt-rounds)
+
+Request payloads come from a seeded RNG, so two runs with the same
+arguments send the same requests. Results are printed (or written to
+--output) as JSON. With --baseline, a scenario whose throughput drops by
+more than --max-throughput-drop, whose p95 latency grows by more than
+--max-latency-increase, or which starts failing requests is reported as a
+regression, and the exit status is 1.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+from common import ROOT, asgi_client, fake_product, free_port, load_app, seed_products, server_command, summarize
+
+SCENARIOS = ["list", "get", "create", "create_image", "update", "delete", "register", "login"]
+AUTH_SCENARIOS = {"register", "login"}
+EMAIL, PASSWORD = "bench@example.com", "secret"
+
+
+# Targets
+
+@asynccontextmanager
+async def in_process(args, directory: str, env: dict):
+    if args.database_url:
+        env = dict(env, DATABASE_URL=args.database_url)
+    main = load_app(os.path.join(directory, "bench.db"), **env)
+    import database
+
+    seed_products(database.SessionLocal, args.rows)
+    try:
+        async with asgi_client(main.app) as client:
+            yield client
+    finally:
+        # The ASGI transport skips the lifespan hook that would do this;
+        # open aiosqlite connections keep the process from exiting.
+        await database.dispose_engines()
+
+
+@asynccontextmanager
+async def served(args, directory: str, env: dict):
+    import httpx
+
+    env = dict(os.environ, **env)
+    env["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    os.environ["DATABASE_URL"] = env["DATABASE_URL"]
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    import database
+
+    seed_products(database.SessionLocal, args.rows)
+    database.engine.dispose()
+
+    port = free_port()
+    process = subprocess.Popen(
+        server_command(args.server, port, args.workers), cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 1)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60.0) as client:
+            deadline = time.perf_counter() + 60
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{args.server} exited with {process.returncode}")
+                try:
+                    if (await client.get("/products/", params={"limit": 1})).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    if time.perf_counter() > deadline:
+                        raise
+                await asyncio.sleep(0.05)
+            yield client
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+# Scenarios: each returns the (method, path, request kwargs) to send.
+
+def form_fields(rng: random.Random) -> dict:
+    return {key: str(value) for key, value in fake_product(rng).items()}
+
+
+def build_requests(scenario: str, count: int, state: dict, rng: random.Random):
+    auth = {"Authorization": f"Bearer {state['token']}"} if state.get("token") else {}
+    rows = state["rows"]
+    if scenario == "list":
+        return [("GET", "/products/", {"params": {"limit": 20}}) for _ in range(count)]
+    if scenario == "get":
+        return [("GET", f"/products/{rng.randint(1, rows)}", {}) for _ in range(count)]
+    if scenario == "create":
+        return [("POST", "/products/", {"data": form_fields(rng), "headers": auth}) for _ in range(count)]
+    if scenario == "create_image":
+        return [
+            ("POST", "/products/", {
+                "data": form_fields(rng),
+                "files": {"image": ("bench.png", rng.randbytes(state["image_size"]), "image/png")},
+                "headers": auth,
+            })
+            for _ in range(count)
+        ]
+    if scenario == "update":
+        return [
+            ("PATCH", f"/products/{rng.randint(1, rows)}", {
+                "json": {"price": round(rng.uniform(1, 500), 2), "status": rng.choice(["active", "draft"])},
+                "headers": auth,
+            })
+            for _ in range(count)
+        ]
+    if scenario == "delete":
+        created, state["created"] = state["created"], []
+        return [("DELETE", f"/products/{product_id}", {"headers": auth}) for product_id in created[:count]]
+    if scenario == "register":
+        state["users"] = state.get("users", 0) + count
+        first = state["users"] - count
+        return [
+            ("POST", "/register", {"json": {"name": f"user{n}", "email": f"user{n}@example.com", "password": PASSWORD}})
+            for n in range(first, first + count)
+        ]
+    if scenario == "login":
+        return [("POST", "/login", {"json": {"email": EMAIL, "password": PASSWORD}}) for _ in range(count)]
+    raise ValueError(scenario)
+
+
+async def run_phase(client, requests, concurrency: int, state: dict):
+    samples, statuses = [], {}
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    async def worker():
+        while not queue.empty():
+            method, path, kwargs = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            samples.append(time.perf_counter() - start)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            if method == "POST" and path == "/products/" and response.status_code == 200:
+                state["created"].append(response.json()["id"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "statuses": statuses,
+        "requests_per_s": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "latency": summarize(samples),
+    }
+
+
+async def login(client, state: dict):
+    response = await client.post("/login", json={"email": EMAIL, "password": PASSWORD})
+    response.raise_for_status()
+    state["token"] = response.json()["access_token"]
+
+
+async def run(args):
+    directory = tempfile.mkdtemp()
+    env = {"UPLOAD_DIR": os.path.join(directory, "images"), "ACCESS_LOG_SAMPLE_RATE": "0", "DB_MODE": args.db_mode}
+    if args.bcrypt_rounds:
+        env["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    target = served if args.server else in_process
+    # The app's log setup would otherwise print every client request.
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    state = {"rows": args.rows, "image_size": args.image_size, "created": []}
+    results = {scenario: {} for scenario in args.scenarios}
+    async with target(args, directory, env) as client:
+        await client.post("/register", json={"name": "bench", "email": EMAIL, "password": PASSWORD})
+        for method, path, kwargs in build_requests("list", args.warmup, state, rng):
+            await client.request(method, path, **kwargs)
+        for concurrency in args.concurrency:
+            # Fresh token per round: a long run can outlive ACCESS_TOKEN_TTL.
+            await login(client, state)
+            for scenario in args.scenarios:
+                count = args.auth_requests if scenario in AUTH_SCENARIOS else args.requests
+                requests = build_requests(scenario, count, state, rng)
+                results[scenario][f"c={concurrency}"] = await run_phase(client, requests, concurrency, state)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "server": f"{args.server} x{args.workers}" if args.server == "gunicorn" else args.server or "asgi",
+            "database": "postgresql" if (args.database_url or "").startswith("postgresql") else "sqlite",
+            "db_mode": args.db_mode,
+            "rows": args.rows,
+            "requests": args.requests,
+            "auth_requests": args.auth_requests,
+            "bcrypt_rounds": args.bcrypt_rounds,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+# Baseline comparison
+
+def compare(baseline: dict, current: dict, max_throughput_drop: float, max_latency_increase: float):
+    """Per scenario/concurrency deltas; the second value lists regressions."""
+    rows, regressions = [], []
+    for scenario, levels in current["results"].items():
+        for level, result in levels.items():
+            before = baseline.get("results", {}).get(scenario, {}).get(level)
+            if not before:
+                continue
+            throughput = result["requests_per_s"] / before["requests_per_s"] - 1 if before["requests_per_s"] else 0.0
+            p95 = result["latency"]["p95_ms"] / before["latency"]["p95_ms"] - 1 if before["latency"]["p95_ms"] else 0.0
+            problems = []
+            if throughput < -max_throughput_drop:
+                problems.append(f"throughput {throughput:+.0%}")
+            if p95 > max_latency_increase:
+                problems.append(f"p95 {p95:+.0%}")
+            if result["errors"] and not before["errors"]:
+                problems.append(f"{result['errors']} errors")
+            rows.append({
+                "scenario": scenario,
+                "level": level,
+                "requests_per_s": [before["requests_per_s"], result["requests_per_s"]],
+                "throughput_change": round(throughput, 4),
+                "p95_ms": [round(before["latency"]["p95_ms"], 2), round(result["latency"]["p95_ms"], 2)],
+                "p95_change": round(p95, 4),
+                "regression": problems,
+            })
+            if problems:
+                regressions.append(f"{scenario} {level}: {', '.join(problems)}")
+    return rows, regressions
+
+
+def report(rows, regressions) -> None:
+    for row in rows:
+        print(
+            f"{row['scenario']:>12} {row['level']:>6}  "
+            f"{row['requests_per_s'][0]:>8.1f} -> {row['requests_per_s'][1]:>8.1f} req/s ({row['throughput_change']:+.0%})  "
+            f"p95 {row['p95_ms'][0]:>8.2f} -> {row['p95_ms'][1]:>8.2f} ms ({row['p95_change']:+.0%})"
+            + ("  REGRESSION" if row["regression"] else ""),
+            file=sys.stderr,
+        )
+    print(f"{len(regressions)} regression(s)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000, help="products seeded before the run")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--auth-requests", type=int, default=20, help="requests per phase for register/login")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--server", choices=["uvicorn", "gunicorn"], help="run a real server instead of in-process")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--database-url", help="local Postgres (empty); default a throwaway SQLite file")
+    parser.add_argument("--db-mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--bcrypt-rounds", type=int, help="override BCRYPT_ROUNDS for the app")
+    parser.add_argument("--image-size", type=int, default=32 * 1024, help="bytes per uploaded image")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests before the first phase")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the results here instead of stdout")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two results files, no run")
+    parser.add_argument("--max-throughput-drop", type=float, default=0.15)
+    parser.add_argument("--max-latency-increase", type=float, default=0.25)
+    args = parser.parse_args()
+    if "delete" in args.scenarios and not {"create", "create_image"} & set(args.scenarios):
+        parser.error("delete removes the products created in the same round; add create or create_image")
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+    else:
+        current = asyncio.run(run(args))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(current, f, indent=2)
+        else:
+            print(json.dumps(current, indent=2))
+        if not args.baseline:
+            return
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    differences = [
+        key for key in current["meta"]
+        if key != "timestamp" and baseline.get("meta", {}).get(key) != current["meta"][key]
+    ]
+    if differences:
+        print(f"warning: runs differ in {', '.join(differences)}; results may not be comparable", file=sys.stderr)
+    rows, regressions = compare(baseline, current, args.max_throughput_drop, args.max_latency_increase)
+    report(rows, regressions)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import random
+import statistics
+import string
+import sys
+import time
+from pathlib import Path
+
+# Benchmarks import the application modules (models, crud, ...) which live at
+# the repository root, so make sure it is importable when run as a script.
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+# Application modules are imported inside the helpers: they read their settings
+# from the environment at import time (see load_app).
+
+STATUSES = ["active", "draft", "archived"]
+VENDORS = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark"]
+PRODUCT_TYPES = ["keyboard", "mouse", "monitor", "headset", "cable", "chair"]
+
+
+def sqlite_session_factory(path: str = ":memory:"):
+    import models
+
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def fake_product(rng: random.Random) -> dict:
+    word = "".join(rng.choices(string.ascii_lowercase, k=8))
+    price = round(rng.uniform(1, 500), 2)
+    cost = round(price * rng.uniform(0.3, 0.9), 2)
+    return {
+        "title": f"{rng.choice(PRODUCT_TYPES).title()} {word}",
+        "description": f"{word} by {rng.choice(VENDORS)}",
+        "price": price,
+        "cost_per_item": cost,
+        "status": rng.choice(STATUSES),
+        "vendor": rng.choice(VENDORS),
+        "product_type": rng.choice(PRODUCT_TYPES),
+        "sku": f"SKU-{rng.randrange(10 ** 8):08d}",
+        "tags": ",".join(rng.sample(["sale", "new", "wireless", "rgb", "eco"], 2)),
+        "collections": rng.choice(["office", "gaming", "travel"]),
+        "inventory_quantity": rng.randint(0, 500),
+    }
+
+
+def seed_products(session_factory, count: int, seed: int = 42, batch: int = 5000):
+    import models
+
+    rng = random.Random(seed)
+    with session_factory() as db:
+        for start in range(0, count, batch):
+            rows = [fake_product(rng) for _ in range(min(batch, count - start))]
+            db.execute(insert(models.Product), rows)
+        db.commit()
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples) -> dict:
+    """Latency summary in milliseconds."""
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def load_app(db_path: str, **env):
+    """Import main.py against a throwaway SQLite database.
+
+    Settings are read from the environment at import time, so they have to
+    be in place before the first import of the application modules.
+    """
+    import os
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.update({key: str(value) for key, value in env.items()})
+    import main
+    import models
+
+    # The ASGI test transport does not run the lifespan hook, and the
+    # throwaway database has not been migrated.
+    models.Base.metadata.create_all(bind=main.engine)
+    return main
+
+
+def free_port() -> int:
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server: str, port: int, workers: int = 1):
+    """Command line starting the app under uvicorn or gunicorn (run from ROOT)."""
+    if server == "gunicorn":
+        return [
+            sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn_conf.py",
+            "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+        ]
+    return [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)]
+
+
+def asgi_client(app):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench")
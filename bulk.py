@@ -0,0 +1,128 @@
+# bulk.py
+# Incremental NDJSON/CSV parsing for POST /products/bulk and row formatting
+# for GET /products/export. Nothing here holds more than one batch in memory.
+import codecs
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+from pydantic import ValidationError
+
+import schemas
+
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+PRODUCT_FIELDS = list(schemas.ProductCreate.model_fields)
+EXPORT_FIELDS = ["id"] + PRODUCT_FIELDS
+
+
+class RowError(Exception):
+    def __init__(self, row: int, errors):
+        super().__init__(f"row {row}: {errors}")
+        self.row = row
+        self.errors = errors
+
+
+def detect_format(content_type: Optional[str], requested: Optional[str]) -> Optional[str]:
+    if requested:
+        return requested if requested in FORMATS else None
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return "csv"
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"):
+        return "ndjson"
+    return None
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[list]:
+    # A quoted CSV field may contain newlines; keep joining lines until the
+    # quotes balance before handing the record to the csv module.
+    record = None
+    async for line in lines:
+        record = line if record is None else record + "\n" + line
+        if record.count('"') % 2 == 0:
+            if record.strip():
+                yield next(csv.reader([record]))
+            record = None
+    if record is not None and record.strip():
+        yield next(csv.reader([record]))
+
+
+async def parse_rows(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[tuple]:
+    """Yield ``(row_number, values)`` for each valid row.
+
+    Invalid rows are yielded as ``(row_number, RowError)`` so the caller can
+    report them and carry on.
+    """
+    if fmt == "ndjson":
+        row = 0
+        async for line in _lines(chunks):
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                data = json.loads(line)
+            except ValueError as exc:
+                yield row, RowError(row, [{"msg": f"Invalid JSON: {exc}"}])
+                continue
+            yield row, _validate(row, data)
+        return
+
+    header = None
+    row = 0
+    async for record in _csv_records(_lines(chunks)):
+        if header is None:
+            header = [name.strip() for name in record]
+            unknown = sorted(set(header) - set(PRODUCT_FIELDS) - {"id"})
+            if unknown:
+                yield 0, RowError(0, [{"msg": f"Unknown columns: {', '.join(unknown)}"}])
+                return
+            continue
+        row += 1
+        if len(record) != len(header):
+            yield row, RowError(row, [{"msg": f"Expected {len(header)} columns, got {len(record)}"}])
+            continue
+        # An empty CSV cell means "not set".
+        data = {name: value for name, value in zip(header, record) if value != "" and name != "id"}
+        yield row, _validate(row, data)
+
+
+def _validate(row: int, data):
+    if not isinstance(data, dict):
+        return RowError(row, [{"msg": "Each row must be a JSON object"}])
+    data.pop("id", None)
+    try:
+        return schemas.ProductCreate.model_validate(data).model_dump()
+    except ValidationError as exc:
+        return RowError(row, exc.errors(include_url=False, include_context=False))
+
+
+def export_lines(rows: Iterable[dict], fmt: str) -> Iterator[str]:
+    if fmt == "ndjson":
+        for row in rows:
+            yield json.dumps(row, separators=(",", ":")) + "\n"
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore", lineterminator="\n")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
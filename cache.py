@@ -0,0 +1,175 @@
+# cache.py
+# Read-through cache for single products, with per-product ETags.
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+import schemas
+from config import PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL
+
+
+class CacheBackend(ABC):
+    """Interface for cache storage.
+
+    The in-process LRUTTLCache below is the default. A shared backend (Redis,
+    memcached, ...) implements the same four methods with serialized values
+    so that every worker sees the same entries and invalidations.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class LRUTTLCache(CacheBackend):
+    """Bounded in-process cache; least recently used entries go first."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        # crud functions run on threadpool workers as well as the event loop.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class NullCache(CacheBackend):
+    """Stores nothing; every lookup goes to the database."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+class CachedProduct(NamedTuple):
+    data: dict
+    etag: str
+
+
+class ProductCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        # Bumped by every invalidation. A fill that started before an
+        # invalidation may have read the old row, so it is not stored.
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(product_id: int) -> str:
+        return f"product:{product_id}"
+
+    def get(self, product_id: int) -> Optional[CachedProduct]:
+        return self.backend.get(self._key(product_id))
+
+    def begin_fill(self) -> int:
+        return self._generation
+
+    def put(self, product, generation: int) -> CachedProduct:
+        data = schemas.Product.model_validate(product, from_attributes=True).model_dump(mode="json")
+        entry = CachedProduct(data, make_etag(data))
+        # Compare-and-set under the lock invalidate() holds, so an
+        # invalidation cannot slip in between the check and the store.
+        with self._lock:
+            if generation == self._generation:
+                self.backend.set(self._key(entry.data["id"]), entry)
+        return entry
+
+    def invalidate(self, product_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            self.backend.delete(self._key(product_id))
+
+    def stats(self) -> Dict[str, int]:
+        return self.backend.stats()
+
+
+def make_etag(data: dict) -> str:
+    # Every write bumps Product.version, so id + version identify the content.
+    return product_etag(data["id"], data["version"])
+
+
+def product_etag(product_id: int, version: int) -> str:
+    return f'"{product_id}-{version}"'
+
+
+def etag_version(etag: str, product_id: int) -> Optional[int]:
+    """Version encoded in a product ETag, or None if it is not one of ours."""
+    etag = etag.strip()
+    if etag.startswith("W/") or len(etag) < 2 or etag[0] != '"' or etag[-1] != '"':
+        return None  # If-Match uses strong comparison
+    tag_id, _, version = etag[1:-1].partition("-")
+    if tag_id != str(product_id) or not version.isdigit():
+        return None
+    return int(version)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored.
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+product_cache = ProductCache(LRUTTLCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL))
@@ -0,0 +1,314 @@
+# changefeed.py
+# Product change events (created / updated / deleted) for GET
+# /products/changes, served as Server-Sent Events.
+#
+# The crud write paths publish after commit. A backend numbers the events
+# and hands them back to every process through ChangeFeed.deliver: the
+# in-process backend directly, the Postgres one through LISTEN/NOTIFY so
+# that all workers see the same, identically numbered feed. Each process
+# keeps the latest events in a ring buffer for clients that resume with
+# Last-Event-ID, and gives every client a bounded queue: a client that
+# cannot keep up is disconnected instead of slowing down writers, and
+# resumes from where it stopped.
+import asyncio
+import itertools
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from config import (
+    CHANGEFEED_BACKEND, CHANGEFEED_BUFFER, CHANGEFEED_CHANNEL, CHANGEFEED_HEARTBEAT, CHANGEFEED_QUEUE_SIZE,
+    DATABASE_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+CREATED = "product.created"
+UPDATED = "product.updated"
+DELETED = "product.deleted"
+# Sent instead of a replay when the requested position is no longer (or not
+# yet) in the buffer: the client should reload its product list.
+RESET = "reset"
+
+
+class Event(NamedTuple):
+    seq: int
+    type: str
+    product_id: int
+    version: Optional[int]
+
+    def to_sse(self) -> str:
+        data = {"id": self.product_id}
+        if self.version is not None:
+            data["version"] = self.version
+        return f"id: {self.seq}\nevent: {self.type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.last_seq = 0
+        self.overflowed = False
+
+
+class ChangeFeed:
+    def __init__(self, backend, buffer_size: int = CHANGEFEED_BUFFER, queue_size: int = CHANGEFEED_QUEUE_SIZE):
+        self.backend = backend
+        self.queue_size = queue_size
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._last_seq = 0
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._listeners: List[Callable[[List[Event]], None]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.disconnected_slow = 0
+
+    # Producers (any thread)
+
+    def publish(self, kind: str, changes: Iterable[Tuple[int, Optional[int]]]) -> None:
+        """Queue ``(product_id, version)`` changes; never blocks on clients."""
+        changes = list(changes)
+        if changes:
+            self.backend.publish(kind, changes)
+
+    def add_listener(self, callback: Callable[[List[Event]], None]) -> None:
+        """Call ``callback(events)`` on every delivery, from the delivering thread."""
+        self._listeners.append(callback)
+
+    def start(self) -> None:
+        """Receive events now rather than on the first subscription."""
+        self.backend.start()
+
+    def deliver(self, events: List[Event]) -> None:
+        """Called by the backend with numbered events, from any thread."""
+        for callback in self._listeners:
+            try:
+                callback(events)
+            except Exception:
+                logger.exception("change feed: listener failed")
+        with self._lock:
+            self._buffer.extend(events)
+            self._last_seq = max(self._last_seq, events[-1].seq)
+            loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._fan_out, events)
+
+    # Consumers (event loop)
+
+    def subscribe(self, since: Optional[int]) -> Tuple[Subscription, List[Event], bool]:
+        """Register a client; returns it with the backlog after ``since``.
+
+        The third value is True when ``since`` cannot be served from the
+        buffer and the client has to start over (see RESET).
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self.backend.start()
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            last_seq = self._last_seq
+            oldest = self._buffer[0].seq if self._buffer else last_seq + 1
+            if since is None:
+                backlog, reset = [], False
+            elif since > last_seq or since < oldest - 1:
+                backlog, reset = [], True
+            else:
+                backlog, reset = [event for event in self._buffer if event.seq > since], False
+            subscription.last_seq = last_seq if since is None or reset else since
+            self._subscribers.add(subscription)
+        return subscription, backlog, reset
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def _fan_out(self, events: List[Event]) -> None:
+        for subscription in list(self._subscribers):
+            for event in events:
+                try:
+                    subscription.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    subscription.overflowed = True
+                    self._subscribers.discard(subscription)
+                    self.disconnected_slow += 1
+                    break
+
+
+async def stream(feed: ChangeFeed, since: Optional[int]):
+    """SSE body for one client."""
+    subscription, backlog, reset = feed.subscribe(since)
+    try:
+        yield "retry: 2000\n\n"
+        if reset:
+            yield f"id: {subscription.last_seq}\nevent: {RESET}\ndata: {{}}\n\n"
+        if backlog:
+            yield "".join(event.to_sse() for event in backlog)
+            subscription.last_seq = backlog[-1].seq
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), CHANGEFEED_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            batch = [event]
+            while not subscription.queue.empty() and len(batch) < 500:
+                batch.append(subscription.queue.get_nowait())
+            # Events already sent as backlog may also arrive live.
+            batch = [event for event in batch if event.seq > subscription.last_seq]
+            if batch:
+                yield "".join(event.to_sse() for event in batch)
+                subscription.last_seq = batch[-1].seq
+            if subscription.overflowed and subscription.queue.empty():
+                return  # too slow: the client reconnects with Last-Event-ID
+    finally:
+        feed.unsubscribe(subscription)
+
+
+# Backends
+
+class InProcessBackend:
+    """Numbers and delivers events inside this process only."""
+
+    def __init__(self):
+        self._feed: Optional[ChangeFeed] = None
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def bind(self, feed: ChangeFeed) -> None:
+        self._feed = feed
+
+    def start(self) -> None:
+        pass
+
+    def publish(self, kind: str, changes) -> None:
+        with self._lock:
+            events = [Event(next(self._seq), kind, product_id, version) for product_id, version in changes]
+            self._feed.deliver(events)
+
+
+class PostgresBackend:
+    """Shares the feed between processes with LISTEN/NOTIFY.
+
+    Sequence numbers come from a database sequence, so every listener sees
+    the same ids. Publishing and listening each use a dedicated psycopg2
+    connection on a background thread; callers never wait on either.
+
+    NOTIFYs reach listeners in commit order, not in nextval() order. Each
+    publish therefore takes a transaction-level advisory lock before
+    numbering its events and keeps it until the commit that sends them, so
+    no other process can commit a higher seq in between. The ring buffer
+    and stream() rely on seqs arriving in increasing order.
+    """
+
+    SEQUENCE = "product_change_seq"
+    # Changes per NOTIFY; payloads are limited to 8000 bytes.
+    CHUNK = 80
+
+    def __init__(self, url: str = DATABASE_URL, channel: str = CHANGEFEED_CHANNEL):
+        from sqlalchemy.engine import make_url
+
+        self.dsn = make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self._feed: Optional[ChangeFeed] = None
+        self._outbox: "queue.Queue" = queue.Queue()
+        self._publisher: Optional[threading.Thread] = None
+        self._listener: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def bind(self, feed: ChangeFeed) -> None:
+        self._feed = feed
+
+    def start(self) -> None:
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="changefeed-listen", daemon=True)
+                self._listener.start()
+
+    def publish(self, kind: str, changes) -> None:
+        with self._lock:
+            if self._publisher is None:
+                self._publisher = threading.Thread(target=self._publish, name="changefeed-notify", daemon=True)
+                self._publisher.start()
+        self._outbox.put((kind, changes))
+
+    def _connect(self):
+        import psycopg2
+
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+
+    def _publish(self):
+        connection = None
+        while True:
+            kind, changes = self._outbox.get()
+            rows = [(kind, product_id, version) for product_id, version in changes]
+            while not self._outbox.empty() and len(rows) < 10 * self.CHUNK:
+                more_kind, more = self._outbox.get_nowait()
+                rows += [(more_kind, product_id, version) for product_id, version in more]
+            try:
+                if connection is None or connection.closed:
+                    connection = self._connect()
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {self.SEQUENCE}")
+                with connection.cursor() as cursor:
+                    cursor.execute("BEGIN")
+                    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (self.SEQUENCE,))
+                    for start in range(0, len(rows), self.CHUNK):
+                        kinds, ids, versions = zip(*rows[start:start + self.CHUNK])
+                        cursor.execute(
+                            "SELECT pg_notify(%s, json_agg(json_build_array("
+                            f"nextval('{self.SEQUENCE}'), c.kind, c.id, c.version))::text) "
+                            "FROM unnest(%s::text[], %s::int[], %s::int[]) AS c(kind, id, version)",
+                            (self.channel, list(kinds), list(ids), list(versions)),
+                        )
+                    cursor.execute("COMMIT")
+            except Exception:
+                logger.exception("change feed: NOTIFY failed, %d events lost", len(rows))
+                if connection is not None:
+                    connection.close()  # also ends the transaction and its lock
+                connection = None
+
+    def _listen(self):
+        while True:
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                while True:
+                    if select.select([connection], [], [], 5.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        payload = connection.notifies.pop(0).payload
+                        events = [Event(*item) for item in json.loads(payload)]
+                        if events:
+                            self._feed.deliver(events)
+            except Exception:
+                logger.exception("change feed: LISTEN connection lost, reconnecting")
+                time.sleep(1.0)
+
+
+def make_backend(name: str = CHANGEFEED_BACKEND):
+    return PostgresBackend() if name == "postgres" else InProcessBackend()
+
+
+def _build(backend) -> ChangeFeed:
+    feed = ChangeFeed(backend)
+    backend.bind(feed)
+    return feed
+
+
+feed = _build(make_backend())
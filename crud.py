@@ -89,51 +89,511 @@
 # #         db.commit()
 # #     return db_product
 
+import io
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, func, insert, or_, select, text, update
+from sqlalchemy.exc import DBAPIError, IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy.orm.exc import StaleDataError
 import models, schemas
+import pagination
+import facets
+from facets import FACET_COLUMNS
+import analytics
+from analytics import FINANCIAL_INPUTS, SUMMARY_COLUMNS
+from cache import product_cache
+from config import SEARCH_BACKEND
+import search
+import changefeed
+
+def products_changed(products, event: str = changefeed.UPDATED):
+    """Post-commit bookkeeping for written products: cache, search index and
+    change feed."""
+    products = list(products)
+    changes = []
+    for product in products:
+        if isinstance(product, dict):
+            product_id, version = product["id"], product.get("version", 1)
+        else:
+            product_id, version = product.id, product.version
+        product_cache.invalidate(product_id)
+        changes.append((product_id, version))
+    search.index.upsert(products)
+    changefeed.feed.publish(event, changes)
+
+def _evict_changed(events):
+    # Writes made by other workers only reach this one through the feed; for
+    # this worker's own writes the eviction above already happened.
+    for event in events:
+        product_cache.invalidate(event.product_id)
+
+changefeed.feed.add_listener(_evict_changed)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def product_removed(product_id: int):
+    product_cache.invalidate(product_id)
+    search.index.remove(product_id)
+    changefeed.feed.publish(changefeed.DELETED, [(product_id, None)])
 
-def create_user(db: Session, name: str, email: str, password: str):
-    hashed_password = pwd_context.hash(password)
+class StaleProduct(Exception):
+    """The product changed since the version the caller based its write on."""
+
+# Hashing happens in passwords.py, off the request path; these functions only
+# store and look up the resulting hashes.
+
+def create_user(db: Session, name: str, email: str, hashed_password: str):
     db_user = models.User(name=name, email=email, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if user and pwd_context.verify(password, user.hashed_password):
-        return user
-    return None
+def get_user_credentials(db: Session, email: str):
+    """Return ``(user_id, hashed_password)`` for ``email``, or None.
+
+    The transaction is ended before returning so the connection goes back to
+    the pool in the same call instead of being held while bcrypt runs.
+    """
+    row = db.query(models.User.id, models.User.hashed_password).filter(models.User.email == email).first()
+    db.rollback()
+    return tuple(row) if row else None
+
+def update_user_password_hash(db: Session, user_id: int, hashed_password: str):
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.hashed_password: hashed_password}, synchronize_session=False
+    )
+    db.commit()
+
+def revoke_refresh_token(db: Session, jti: str, expires_at: int) -> bool:
+    """Record refresh token ``jti`` as spent; False if it already was.
+
+    The primary key makes this a single atomic claim shared by every worker,
+    so a refresh token is accepted once however many processes see it.
+    Entries whose token has expired are dropped on the way.
+    """
+    db.execute(delete(models.RevokedToken).where(models.RevokedToken.expires_at < int(time.time())))
+    db.add(models.RevokedToken(jti=jti, expires_at=expires_at))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return True
 
 def create_product(db: Session, product: schemas.ProductCreate):
-    db_product = models.Product(**product.dict())
+    db_product = models.Product(**analytics.with_financials(product.dict()))
     db.add(db_product)
+    db.flush()
+    sync_product_facets(db, [db_product])
+    record_summary(db, [], [db_product])
     db.commit()
     db.refresh(db_product)
+    products_changed([db_product], changefeed.CREATED)
     return db_product
 
 def get_product(db: Session, product_id: int):
     return db.query(models.Product).filter(models.Product.id == product_id).first()
 
-def get_products(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(models.Product).offset(skip).limit(limit).all()
+def product_columns(fields: Iterable[str]):
+    """Model columns for a sparse fieldset, in order, without duplicates."""
+    return [getattr(models.Product, name) for name in dict.fromkeys(fields)]
+
+def get_products(db: Session, skip: int = 0, limit: int = 10, sort: str = "id", filters: Optional[dict] = None, columns=None):
+    """Products as ORM objects, or as plain rows of ``columns`` when given."""
+    return (
+        (db.query(*columns) if columns else db.query(models.Product))
+        .filter(*facets.filter_clauses(**(filters or {})))
+        .order_by(*pagination.order_by(sort))
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+def get_products_page(db: Session, limit: int = 10, cursor: str = None, sort: str = "id", filters: Optional[dict] = None, columns=None):
+    """Keyset pagination: return ``(products, next_cursor)``.
+
+    Seeks past the last row of the previous page instead of using OFFSET, so
+    the cost of a page does not grow with how deep into the listing it is.
+    With ``columns`` (which must include id and the sort key) plain rows are
+    returned instead of ORM objects.
+    """
+    rows = []
+    clauses = facets.filter_clauses(**(filters or {}))
+    for seek in pagination.seek_filters(sort, cursor):
+        query = (db.query(*columns) if columns else db.query(models.Product)).filter(*clauses)
+        if seek is not None:
+            query = query.filter(seek)
+        # Fetch one extra row to find out whether another page follows.
+        rows += query.order_by(*pagination.order_by(sort)).limit(limit + 1 - len(rows)).all()
+        if len(rows) > limit:
+            break
+    return pagination.split_page(rows, limit, sort)
+
+# What a row the database (or its driver) refuses raises: wrapped DBAPI
+# errors, and values the driver cannot convert (integers too large for
+# SQLite, NUL characters for psycopg2).
+ROW_ERRORS = (SQLAlchemyError, ValueError, OverflowError)
+
+def bulk_create_products(db: Session, rows: List[Tuple[int, dict]]) -> List[Tuple[int, str]]:
+    """Insert a batch of validated ``(row_number, values)`` pairs.
+
+    The batch goes in with one COPY on psycopg2 and one executemany
+    elsewhere. If the database rejects it, the rows are retried one by one
+    under savepoints so only the offending rows are dropped; those are
+    returned as ``(row_number, message)``.
+    """
+    if not rows:
+        return []
+    rows = [(row_number, analytics.with_financials(values)) for row_number, values in rows]
+    try:
+        values = [values for _, values in rows]
+        ids = _insert_products(db, values)
+        inserted = [dict(row, id=product_id) for row, product_id in zip(values, ids)]
+        sync_product_facets(db, inserted, replace=False)
+        record_summary(db, [], inserted)
+        db.commit()
+        products_changed(inserted, changefeed.CREATED)
+        return []
+    except ROW_ERRORS:
+        db.rollback()
+
+    failures, inserted = [], []
+    for row_number, values in rows:
+        try:
+            with db.begin_nested():
+                product_id = db.execute(insert(models.Product).returning(models.Product.id), values).scalar_one()
+                sync_product_facets(db, [dict(values, id=product_id)], replace=False)
+            inserted.append(dict(values, id=product_id))
+        except ROW_ERRORS as exc:
+            failures.append((row_number, str(exc.orig if getattr(exc, "orig", None) else exc)))
+    record_summary(db, [], inserted)
+    db.commit()
+    products_changed(inserted, changefeed.CREATED)
+    return failures
+
+def _insert_products(db: Session, values: List[dict]) -> List[int]:
+    connection = db.connection()
+    if connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg2":
+        # COPY cannot return generated keys, so reserve the ids up front.
+        ids = db.execute(
+            text("SELECT nextval(pg_get_serial_sequence('products', 'id')) FROM generate_series(1, :n)"),
+            {"n": len(values)},
+        ).scalars().all()
+        values = [dict(row, id=product_id) for row, product_id in zip(values, ids)]
+        columns = list(values[0])
+        buffer = io.StringIO()
+        for row in values:
+            buffer.write("\t".join(_copy_value(row[column]) for column in columns))
+            buffer.write("\n")
+        buffer.seek(0)
+        statement = f"COPY products ({', '.join(columns)}) FROM STDIN WITH (FORMAT text)"
+        cursor = connection.connection.driver_connection.cursor()
+        try:
+            cursor.copy_expert(statement, buffer)
+        except connection.dialect.dbapi.Error as error:
+            # Raw driver errors: wrap them like SQLAlchemy does for execute()
+            # so the caller falls back to row-by-row inserts.
+            raise DBAPIError.instance(statement, None, error, connection.dialect.dbapi.Error)
+        finally:
+            cursor.close()
+        return ids
+    return db.execute(
+        insert(models.Product).returning(models.Product.id, sort_by_parameter_order=True), values
+    ).scalars().all()
+
+def _copy_value(value) -> str:
+    # COPY text format: \N is NULL; backslash and control characters escaped.
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+def iter_products(db: Session, batch_size: int = 1000) -> Iterator[dict]:
+    """Stream every product as a plain dict, ordered by id.
+
+    Uses a server-side cursor (yield_per) so memory stays flat however large
+    the catalog is.
+    """
+    result = db.execute(
+        select(*models.Product.__table__.columns)
+        .order_by(models.Product.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for row in result.mappings():
+        yield dict(row)
+
+def count_image_references(db: Session, image_url: str) -> int:
+    """Products using ``image_url``, counted on a connection of its own.
+
+    storage.release_image counts twice around removing a file, and each
+    count has to see the rows committed since the previous one. The
+    session's own transaction may not see them, and ending it would expire
+    the product the caller is about to return.
+    """
+    stmt = select(func.count(models.Product.id)).where(models.Product.image_url == image_url)
+    with db.get_bind().connect() as connection:
+        return connection.execute(stmt).scalar()
 
 def update_product(db: Session, product_id: int, product: schemas.ProductCreate):
     db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if db_product:
-        for key, value in product.dict().items():
+        before = analytics.snapshot(db_product)
+        for key, value in analytics.with_financials(product.dict()).items():
             setattr(db_product, key, value)
-        db.commit()
+        sync_product_facets(db, [db_product])
+        record_summary(db, [before], [db_product])
+        try:
+            db.commit()
+        except StaleDataError:
+            db.rollback()
+            raise StaleProduct(product_id)
         db.refresh(db_product)
+        products_changed([db_product])
     return db_product
 
+def patch_statement(product_id: int, values: dict, expected_version: Optional[int] = None):
+    stmt = update(models.Product).where(models.Product.id == product_id)
+    if expected_version is not None:
+        stmt = stmt.where(models.Product.version == expected_version)
+    if FINANCIAL_INPUTS.intersection(values):
+        values = dict(values, **analytics.financial_expressions(
+            values.get("price", models.Product.price), values.get("cost_per_item", models.Product.cost_per_item)
+        ))
+    return (
+        stmt.values(**values, version=models.Product.version + 1)
+        .returning(models.Product)
+        .execution_options(synchronize_session=False)
+    )
+
+def commit_returned(db: Session):
+    """Commit without expiring the session's objects.
+
+    Products written with ``UPDATE ... RETURNING`` already hold their new
+    state; expiring them on commit would reload each one with its own SELECT
+    when it is published and serialized. (Async sessions never expire on
+    commit.)
+    """
+    expire, db.expire_on_commit = db.expire_on_commit, False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire
+
+def patch_product(db: Session, product_id: int, values: dict, expected_version: Optional[int] = None):
+    """Write only ``values`` with a single ``UPDATE ... RETURNING``.
+
+    Returns the updated product, or None if it does not exist. Raises
+    StaleProduct if ``expected_version`` no longer matches.
+    """
+    before = summary_snapshot(db, [product_id]) if SUMMARY_COLUMNS.intersection(values) else None
+    db_product = db.scalars(patch_statement(product_id, values, expected_version)).first()
+    if db_product is None:
+        db.rollback()
+        # Only the failure path pays for telling "missing" from "stale".
+        if expected_version is not None and db.get(models.Product, product_id) is not None:
+            raise StaleProduct(product_id)
+        return None
+    if FACET_COLUMNS.intersection(values):
+        sync_product_facets(db, [db_product])
+    if before is not None:
+        record_summary(db, before, [db_product])
+    commit_returned(db)
+    products_changed([db_product])
+    return db_product
+
+def batch_patch_statement(updates: List[dict]):
+    columns = sorted({key for item in updates for key in item} - {"id", "version"})
+    values = {
+        column: case(
+            *[(models.Product.id == item["id"], item[column]) for item in updates if column in item],
+            else_=getattr(models.Product, column),
+        )
+        for column in columns
+    }
+    if FINANCIAL_INPUTS.intersection(columns):
+        values.update(analytics.financial_expressions(
+            values.get("price", models.Product.price), values.get("cost_per_item", models.Product.cost_per_item)
+        ))
+    unversioned = [item["id"] for item in updates if item.get("version") is None]
+    matches = [models.Product.id.in_(unversioned)] if unversioned else []
+    matches += [
+        and_(models.Product.id == item["id"], models.Product.version == item["version"])
+        for item in updates if item.get("version") is not None
+    ]
+    return (
+        update(models.Product)
+        .where(or_(*matches))
+        .values(**values, version=models.Product.version + 1)
+        .returning(models.Product)
+        .execution_options(synchronize_session=False)
+    )
+
+def batch_patch_products(db: Session, updates: List[dict]):
+    """Apply per-product changes to many products in one UPDATE statement.
+
+    Each item holds an ``id``, the columns to change and optionally the
+    expected ``version``. Returns ``(updated_products, skipped_ids)``; ids
+    that do not exist or whose version did not match are skipped.
+    """
+    before = None
+    if any(SUMMARY_COLUMNS.intersection(item) for item in updates):
+        before = summary_snapshot(db, [item["id"] for item in updates])
+    products = db.scalars(batch_patch_statement(updates)).all()
+    updated = {product.id for product in products}
+    if any(FACET_COLUMNS.intersection(item) for item in updates):
+        sync_product_facets(db, products)
+    if before is not None:
+        record_summary(db, [row for row in before if row["id"] in updated], products)
+    commit_returned(db)
+    products_changed(products)
+    return products, [item["id"] for item in updates if item["id"] not in updated]
+
 def delete_product(db: Session, product_id: int):
     db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if db_product:
+        db.execute(delete(models.ProductFacet).where(models.ProductFacet.product_id == product_id))
+        record_summary(db, [db_product], [])
         db.delete(db_product)
-        db.commit()
+        try:
+            # The DELETE is version-checked; a write since the load fails it.
+            db.commit()
+        except StaleDataError:
+            db.rollback()
+            raise StaleProduct(product_id)
+        product_removed(product_id)
     return db_product
+
+# Search (see search.py)
+
+def search_statement(q: str, limit: int = 20):
+    """Postgres full-text query: every term as a prefix, best ts_rank_cd first."""
+    vector = models.product_search_vector()
+    query = func.to_tsquery(text("'simple'"), search.tsquery_text(q))
+    return (
+        select(models.Product)
+        .where(vector.op("@@")(query))
+        .order_by(func.ts_rank_cd(vector, query).desc(), models.Product.id)
+        .limit(limit)
+    )
+
+def search_products(db: Session, q: str, limit: int = 20):
+    if search.tsquery_text(q) is None:
+        return []
+    if SEARCH_BACKEND == "postgres":
+        return db.scalars(search_statement(q, limit)).all()
+    if not search.index.built:
+        load_search_index(db)
+    ids = search.index.search(q, limit)
+    if not ids:
+        return []
+    found = {p.id: p for p in db.scalars(select(models.Product).where(models.Product.id.in_(ids)))}
+    return [found[product_id] for product_id in ids if product_id in found]
+
+def load_search_index(db: Session, batch_size: int = 1000) -> int:
+    """(Re)build the in-process search index from the products table."""
+    columns = [models.Product.id] + [getattr(models.Product, f) for f in search.SEARCH_FIELDS]
+    result = db.execute(select(*columns).execution_options(yield_per=batch_size))
+    search.index.build(dict(row) for row in result.mappings())
+    return len(search.index)
+
+# Facets (see facets.py)
+
+def sync_product_facets(db: Session, products, replace: bool = True):
+    """Rewrite the junction rows of ``products`` from their string columns.
+
+    ``products`` are ORM objects or mappings carrying ``id`` and the facet
+    columns. Runs inside the caller's transaction.
+    """
+    products = list(products)
+    if not products:
+        return
+    if replace:
+        ids = [p["id"] if isinstance(p, dict) else p.id for p in products]
+        db.execute(delete(models.ProductFacet).where(models.ProductFacet.product_id.in_(ids)))
+    rows = [row for product in products for row in facets.facet_rows(product)]
+    if rows:
+        db.execute(insert(models.ProductFacet), rows)
+
+def get_facet_counts(db: Session, filters: Optional[dict] = None, limit: int = 50):
+    return facets.collect_counts(db.execute(facets.count_statement(filters or {})), limit)
+
+def rebuild_product_facets(db: Session, batch_size: int = 1000) -> int:
+    """Backfill product_facets from the string columns of every product."""
+    columns = [models.Product.id] + [getattr(models.Product, c) for c in FACET_COLUMNS]
+    last_id, total = 0, 0
+    while True:
+        batch = db.execute(
+            select(*columns).where(models.Product.id > last_id).order_by(models.Product.id).limit(batch_size)
+        ).mappings().all()
+        if not batch:
+            return total
+        sync_product_facets(db, [dict(row) for row in batch])
+        db.commit()
+        last_id, total = batch[-1]["id"], total + len(batch)
+
+# Catalog analytics (see analytics.py)
+
+def summary_snapshot(db: Session, product_ids: List[int]) -> List[dict]:
+    """Current summary inputs of ``product_ids``, locked until commit.
+
+    Read before an UPDATE that only returns the new state, so the old
+    contribution can be subtracted; the row lock keeps a concurrent writer
+    from changing it in between.
+    """
+    columns = [getattr(models.Product, column) for column in analytics.SNAPSHOT_COLUMNS]
+    stmt = select(*columns).where(models.Product.id.in_(product_ids)).with_for_update()
+    return [dict(row) for row in db.execute(stmt).mappings()]
+
+def record_summary(db: Session, before, after):
+    """Move product_summary from the ``before`` to the ``after`` state of
+    the written products. Runs inside the caller's transaction."""
+    rows = analytics.summary_delta(before, after)
+    if rows:
+        db.execute(analytics.upsert_statement(db.get_bind().dialect.name), rows)
+
+def get_product_summary(db: Session, dimensions: Optional[List[str]] = None):
+    stmt = select(models.ProductSummary).where(models.ProductSummary.products > 0)
+    if dimensions:
+        stmt = stmt.where(models.ProductSummary.dimension.in_(dimensions))
+    return analytics.present(db.scalars(stmt))
+
+def rebuild_product_summary(db: Session) -> int:
+    """Recompute product_summary from the products table.
+
+    On Postgres the table is locked first, so concurrent writers wait and
+    apply their deltas on top of the rebuilt totals.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE product_summary IN EXCLUSIVE MODE"))
+    db.execute(delete(models.ProductSummary))
+    total = 0
+    for stmt in analytics.aggregate_statements():
+        total += db.execute(
+            insert(models.ProductSummary).from_select(["dimension", "value", *analytics.MEASURES], stmt)
+        ).rowcount
+    db.commit()
+    return total
+
+def check_product_summary(db: Session) -> List[dict]:
+    """Compare product_summary with totals recomputed from products.
+
+    Returns the differences; empty when the incremental totals are right.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        # Both reads must see the same snapshot.
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    summary = models.ProductSummary
+    stored = db.execute(
+        select(summary.dimension, summary.value, *[getattr(summary, measure) for measure in analytics.MEASURES])
+    ).all()
+    expected = [row for stmt in analytics.aggregate_statements() for row in db.execute(stmt)]
+    db.rollback()
+    return analytics.compare(stored, expected)
@@ -0,0 +1,108 @@
+# facets.py
+# Tags, collections, markets and sales channels are stored on Product as
+# comma-separated strings (the API keeps that form). Each value is mirrored
+# into the indexed product_facets junction table so filters and facet counts
+# become index lookups instead of LIKE scans.
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, func, literal, select, union_all
+
+import models
+
+# Facet name -> Product column holding the comma-separated values
+MULTI_VALUE_FACETS = {
+    "tag": "tags",
+    "collection": "collections",
+    "market": "markets",
+    "sales_channel": "sales_channels",
+}
+# Single-valued columns that can be filtered and counted directly
+COLUMN_FACETS = ("vendor", "product_type", "status")
+FACET_COLUMNS = frozenset(MULTI_VALUE_FACETS.values())
+
+
+def split_values(raw: Optional[str]) -> List[str]:
+    if not raw:
+        return []
+    seen = []
+    for value in raw.split(","):
+        value = value.strip()
+        if value and value not in seen:
+            seen.append(value)
+    return seen
+
+
+def facet_rows(product) -> List[dict]:
+    """Junction rows for one product (an ORM object or a mapping)."""
+    get = product.get if isinstance(product, dict) else lambda key: getattr(product, key)
+    product_id = get("id")
+    return [
+        {"product_id": product_id, "facet": facet, "value": value}
+        for facet, column in MULTI_VALUE_FACETS.items()
+        for value in split_values(get(column))
+    ]
+
+
+def filter_clauses(
+    tag: Optional[List[str]] = None,
+    collection: Optional[List[str]] = None,
+    market: Optional[List[str]] = None,
+    sales_channel: Optional[List[str]] = None,
+    vendor: Optional[List[str]] = None,
+    product_type: Optional[List[str]] = None,
+    status: Optional[List[str]] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+):
+    """WHERE clauses for product filters.
+
+    Several values for one facet match any of them; different facets must
+    all match.
+    """
+    clauses = []
+    for facet, values in (("tag", tag), ("collection", collection), ("market", market), ("sales_channel", sales_channel)):
+        if values:
+            clauses.append(models.Product.id.in_(
+                select(models.ProductFacet.product_id).where(
+                    and_(models.ProductFacet.facet == facet, models.ProductFacet.value.in_(values))
+                )
+            ))
+    for column, values in (("vendor", vendor), ("product_type", product_type), ("status", status)):
+        if values:
+            clauses.append(getattr(models.Product, column).in_(values))
+    if min_price is not None:
+        clauses.append(models.Product.price >= min_price)
+    if max_price is not None:
+        clauses.append(models.Product.price <= max_price)
+    return clauses
+
+
+def count_statement(filters: Dict):
+    """One query returning ``(facet, value, count)`` rows for every facet."""
+    clauses = filter_clauses(**filters)
+    matching = select(models.Product.id).where(*clauses).subquery()
+    statements = [
+        select(models.ProductFacet.facet, models.ProductFacet.value, func.count(models.ProductFacet.product_id))
+        .join(matching, matching.c.id == models.ProductFacet.product_id)
+        .group_by(models.ProductFacet.facet, models.ProductFacet.value)
+    ]
+    for column in COLUMN_FACETS:
+        attr = getattr(models.Product, column)
+        statements.append(
+            select(literal(column), attr, func.count(models.Product.id))
+            .where(*clauses, attr.isnot(None))
+            .group_by(attr)
+        )
+    return union_all(*statements)
+
+
+def collect_counts(rows: Iterable, limit: int) -> Dict[str, Dict[str, int]]:
+    counts = {facet: {} for facet in list(MULTI_VALUE_FACETS) + list(COLUMN_FACETS)}
+    for facet, value, count in rows:
+        counts[facet][value] = count
+    # Most common values first, capped per facet.
+    return {
+        facet: dict(sorted(values.items(), key=lambda item: (-item[1], item[0]))[:limit])
+        for facet, values in counts.items()
+    }
+
@@ -0,0 +1,43 @@
+# gunicorn_conf.py
+# Production entry point (see Procfile):
+#
+#     gunicorn main:app -c gunicorn_conf.py
+#
+# The app is imported once in the master and forked into WEB_CONCURRENCY
+# uvicorn workers. Importing main does not touch the database; each worker
+# opens its own connections and warms up in the lifespan hook before it
+# accepts requests.
+#
+# Some state stays per worker: revoked access tokens (/logout; they expire
+# within ACCESS_TOKEN_TTL, refresh tokens are revoked in the database), the
+# in-memory search index (SEARCH_BACKEND=memory) and, with CHANGEFEED_BACKEND=memory,
+# the change feed. Run Postgres for anything beyond one worker.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Seconds a worker gets to finish in-flight requests after SIGTERM.
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+accesslog = None  # requests are logged by the app (logs.log_request)
+
+
+def post_fork(server, worker):
+    import cache
+    import changefeed
+    import database
+    import logs
+
+    # Connections opened in the master must not be shared with the workers;
+    # close=False leaves them to the master instead of closing them under it.
+    for engine in database.engines():
+        engine.dispose(close=False)
+    logs.after_fork()
+    # The in-process change feed cannot tell this worker about writes made
+    # by the others, so a cached product could stay stale until it expires.
+    if server.cfg.workers > 1 and isinstance(changefeed.feed.backend, changefeed.InProcessBackend):
+        cache.product_cache.backend = cache.NullCache()
@@ -0,0 +1,198 @@
+# images.py
+# Serves files from the image store (see storage.py) for GET /images/...
+#
+# Stored names never change content (content-addressed, or random for older
+# uploads), so responses carry strong ETags and are cacheable forever.
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+import anyio
+from fastapi import Request, Response
+from starlette.types import Receive, Scope, Send
+
+import storage
+from config import IMAGE_STAT_CACHE_SIZE, IMAGE_STAT_CACHE_TTL, UPLOAD_CHUNK_SIZE
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Sent with every response: browsers must not sniff a type other than the
+# one given, and nothing served from here may run scripts.
+SECURITY_HEADERS = {"X-Content-Type-Options": "nosniff", "Content-Security-Policy": "default-src 'none'; sandbox"}
+_SHA256_NAME = re.compile(r"^[0-9a-f]{64}$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FileInfo(NamedTuple):
+    size: int
+    etag: str
+    content_type: str
+    # Files that are not one of storage.IMAGE_TYPES (older uploads kept the
+    # client's extension) are only offered as downloads.
+    attachment: bool
+
+
+class StatCache:
+    """Small LRU of stat results so hot images skip the filesystem lookup."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, FileInfo]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[FileInfo]:
+        with self._lock:
+            item = self._data.get(path)
+            if item is None or item[0] <= time.monotonic():
+                return None
+            self._data.move_to_end(path)
+            return item[1]
+
+    def set(self, path: str, info: FileInfo):
+        with self._lock:
+            self._data[path] = (time.monotonic() + self.ttl, info)
+            self._data.move_to_end(path)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, path: str):
+        with self._lock:
+            self._data.pop(path, None)
+
+
+stat_cache = StatCache(IMAGE_STAT_CACHE_SIZE, IMAGE_STAT_CACHE_TTL)
+
+
+def _file_info(path: str) -> Optional[FileInfo]:
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not os.path.isfile(path):
+        return None
+    name = os.path.splitext(os.path.basename(path))[0]
+    if _SHA256_NAME.match(name):
+        etag = f'"{name}"'
+    else:
+        etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    content_type = storage.IMAGE_TYPES.get(os.path.splitext(path)[1].lower())
+    return FileInfo(st.st_size, etag, content_type or "application/octet-stream", content_type is None)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Return the inclusive (start, end) of a single byte range.
+
+    None means "send the whole file" (no header, or a form we do not serve
+    partially, such as multiple ranges). Unsatisfiable ranges raise ValueError.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """Sends ``count`` bytes of an already opened file starting at ``offset``.
+
+    Uses the ASGI zero-copy send extension (sendfile) when the server offers
+    it, then path send for whole files, and falls back to chunked reads.
+    """
+
+    def __init__(self, file, path: str, offset: int, count: int, status_code: int, headers: dict, send_body: bool):
+        super().__init__(status_code=status_code, headers=headers)
+        self.file = file
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.send_body = send_body
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            extensions = scope.get("extensions") or {}
+            if not self.send_body or self.count == 0:
+                await send({"type": "http.response.body", "body": b""})
+            elif "http.response.zerocopysend" in extensions:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": self.file,
+                    "offset": self.offset,
+                    "count": self.count,
+                })
+            elif "http.response.pathsend" in extensions and self.offset == 0 and self.count == os.fstat(self.file.fileno()).st_size:
+                await send({"type": "http.response.pathsend", "path": self.path})
+            else:
+                await anyio.to_thread.run_sync(self.file.seek, self.offset)
+                remaining = self.count
+                while remaining > 0:
+                    chunk = await anyio.to_thread.run_sync(self.file.read, min(UPLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b""})
+        finally:
+            await anyio.to_thread.run_sync(self.file.close)
+
+
+async def serve(request: Request, image_url: str) -> Response:
+    path = storage.path_for_url(image_url)
+    if path is None:
+        return Response(status_code=404, headers=SECURITY_HEADERS)
+    info = stat_cache.get(path)
+    if info is None:
+        info = await anyio.to_thread.run_sync(_file_info, path)
+        if info is None:
+            return Response(status_code=404, headers=SECURITY_HEADERS)
+        stat_cache.set(path, info)
+
+    headers = {"ETag": info.etag, "Cache-Control": CACHE_CONTROL, "Accept-Ranges": "bytes", **SECURITY_HEADERS}
+    if info.attachment:
+        headers["Content-Disposition"] = "attachment"
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or info.etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range.strip() == info.etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), info.size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{info.size}"
+            return Response(status_code=416, headers=headers)
+
+    try:
+        file = await anyio.to_thread.run_sync(open, path, "rb")
+    except FileNotFoundError:
+        # Released since it was stat'ed.
+        stat_cache.discard(path)
+        return Response(status_code=404, headers=SECURITY_HEADERS)
+
+    headers["Content-Type"] = info.content_type
+    if byte_range is None:
+        offset, count, status_code = 0, info.size, 200
+    else:
+        start, end = byte_range
+        offset, count, status_code = start, end - start + 1, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+    headers["Content-Length"] = str(count)
+    return FileRangeResponse(file, path, offset, count, status_code, headers, send_body=request.method != "HEAD")
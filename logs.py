@@ -0,0 +1,101 @@
+# logs.py
+# Non-blocking logging. Records are handed to a bounded queue and written by
+# a background thread (QueueHandler/QueueListener), so a slow stdout or disk
+# never stalls a request. Access logs are sampled, structured JSON lines.
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from typing import Optional
+
+from config import ACCESS_LOG_SAMPLE_RATE, LOG_LEVEL, LOG_QUEUE_SIZE, SLOW_REQUEST_MS
+
+access_logger = logging.getLogger("access")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Drops records instead of blocking (or erroring) once the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+
+
+def setup_logging() -> None:
+    """Route the root logger through the queue; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def after_fork() -> None:
+    """Restart the writer thread in a forked worker (threads do not survive
+    fork, so records queued there would never be written)."""
+    global _listener
+    if _listener is None:
+        return
+    queue_handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush what is queued and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_request(method: str, path: str, route: str, status: int, duration: float, stats) -> None:
+    slow = duration * 1000 >= SLOW_REQUEST_MS
+    if status < 500 and not slow and random.random() >= ACCESS_LOG_SAMPLE_RATE:
+        return
+    if not access_logger.isEnabledFor(logging.INFO):
+        return
+    access_logger.info("request", extra={"fields": {
+        "method": method,
+        "path": path,
+        "route": route,
+        "status": status,
+        "duration_ms": round(duration * 1000, 2),
+        "db_queries": stats.queries,
+        "db_ms": round(stats.db_seconds * 1000, 2),
+        "slow": slow,
+        "sampled": status < 500 and not slow,
+    }})
@@ -1,22 +1,77 @@
 
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form, Request
+from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from database import get_db, engine
-from crud import create_user, authenticate_user
-from pathlib import Path
-import os
-import shutil
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+import database
+from database import get_db, get_read_db, engine, DBSession, ReadSessionLocal
+from async_crud import run_crud
+from contextlib import asynccontextmanager
+import time
 from typing import List, Optional
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 import models, schemas, crud
-from database import engine, SessionLocal
+import analytics
+import pagination
+import passwords
+import tokens
+import changefeed
+import storage
+import images
+import bulk
+from config import (
+    BULK_BATCH_SIZE, DB_AUTO_CREATE, DB_MODE, DB_POOL_SIZE, EXPORT_BATCH_SIZE, MAX_PAGE_SIZE, SEARCH_BACKEND,
+    WARMUP_CONNECTIONS, WARMUP_PRODUCTS, WARMUP_SEARCH_INDEX,
+)
+from cache import product_cache, etag_matches, etag_version, product_etag
+import logs
+import metrics
 import logging
 
-# Initialize and configure the app
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# Startup and shutdown. Nothing touches the database at import time, so a
+# preloading server (gunicorn_conf.py) can fork workers before any
+# connection exists; each worker then warms up here before it is handed
+# requests. The schema itself is managed by Alembic (see migrations/).
+async def warm_up():
+    connections = min(WARMUP_CONNECTIONS, DB_POOL_SIZE)
+    if DB_MODE == "async":
+        await database.warm_async_pool(database.async_engine, connections)
+        if database.async_read_engine is not database.async_engine:
+            await database.warm_async_pool(database.async_read_engine, connections)
+    else:
+        await run_in_threadpool(database.warm_pool, engine, connections)
+        if database.read_engine is not engine:
+            await run_in_threadpool(database.warm_pool, database.read_engine, connections)
+
+    def fill_caches():
+        with ReadSessionLocal() as db:
+            generation = product_cache.begin_fill()
+            for product in crud.get_products(db, limit=WARMUP_PRODUCTS, sort="-id"):
+                product_cache.put(product, generation)
+            if SEARCH_BACKEND == "memory" and WARMUP_SEARCH_INDEX:
+                crud.load_search_index(db)
+
+    await run_in_threadpool(fill_caches)
 
-app = FastAPI(title="Product API with Image Upload")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_AUTO_CREATE:
+        await run_in_threadpool(models.Base.metadata.create_all, bind=engine)
+    # Listen for other workers' writes before serving cached reads.
+    changefeed.feed.start()
+    started = time.perf_counter()
+    try:
+        await warm_up()
+        logger.info("Warm-up finished in %.2fs", time.perf_counter() - started)
+    except Exception:
+        # Still serve: pools and caches fill on demand once the DB is back.
+        logger.exception("Warm-up failed")
+    yield
+    await database.dispose_engines()
+
+app = FastAPI(title="Product API with Image Upload", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Configure CORS for frontend interaction
 origins = ["http://localhost:5173"]  # Update with your frontend URL if necessary
@@ -26,29 +81,62 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Range", "Accept-Ranges"],
 )
 
-# Logging middleware
-logging.basicConfig(level=logging.INFO)
+# Instrumentation and access logs (see metrics.py and logs.py)
+logs.setup_logging()
+for db_engine in database.engines():
+    metrics.instrument_engine(db_engine)
+# Oversized uploads are refused before the form is parsed (see storage.py).
+app.add_middleware(storage.UploadSizeLimit)
+app.add_middleware(metrics.MetricsMiddleware)
+
+def runtime_metrics():
+    cache = product_cache.stats()
+    yield "product_cache_entries", "gauge", "Products held in the read cache.", [({}, cache.get("size", 0))]
+    yield "product_cache_events_total", "counter", "Product cache lookups and removals.", [
+        ({"event": event}, cache[event]) for event in ("hits", "misses", "evictions", "expirations") if event in cache
+    ]
+    yield "password_hash_queue_depth", "gauge", "bcrypt calls running or queued.", [({}, passwords.queue_depth())]
+    feed = changefeed.feed
+    yield "changefeed_clients", "gauge", "Connected change feed clients.", [({}, len(feed))]
+    yield "changefeed_last_event_id", "gauge", "Id of the newest change event.", [({}, feed.last_seq)]
+    yield "changefeed_slow_disconnects_total", "counter", "Clients dropped for falling behind.", [({}, feed.disconnected_slow)]
+
+metrics.register_collector(runtime_metrics)
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logging.info(f"Request: {request.method} {request.url}")
-    response = await call_next(request)
-    logging.info(f"Response: {response.status_code}")
-    return response
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-# Database dependency
-def get_db():
-    db = SessionLocal()
+@app.exception_handler(passwords.PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: passwords.PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(crud.StaleProduct)
+async def stale_product_handler(request: Request, exc: crud.StaleProduct):
+    return JSONResponse(status_code=409, content={"detail": "Product was modified concurrently; reload and retry"})
+
+# Image storage (see storage.py)
+storage.init_storage()
+
+async def store_image(image: UploadFile) -> storage.StoredImage:
     try:
-        yield db
-    finally:
-        db.close()
+        return await storage.save_image(image)
+    except storage.InvalidImage as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except storage.ImageTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
 
-# Upload directory for images
-UPLOAD_DIR = "uploads/images"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Serve stored product images (the URLs handed out in image_url)
+@app.api_route("/images/{image_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_image(image_path: str, request: Request):
+    return await images.serve(request, storage.IMAGE_URL_PREFIX + image_path)
 
 # Welcome endpoint
 @app.get("/")
@@ -57,42 +145,270 @@ def welcome():
 
 # User Registration Endpoint
 @app.post("/register")
-def register(user: schemas.UserRegister, db: Session = Depends(get_db)):
-    db_user = create_user(db, user.name, user.email, user.password)
+async def register(user: schemas.UserRegister, db: DBSession = Depends(get_db)):
+    hashed_password = await passwords.hash_password(user.password)
+    db_user = await run_crud(db, crud.create_user, user.name, user.email, hashed_password)
     if not db_user:
         raise HTTPException(status_code=400, detail="User registration failed")
     return {"message": "User registered successfully"}
 
 # User Login Endpoint
 @app.post("/login")
-def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
-    user_obj = authenticate_user(db, user.email, user.password)
-    if not user_obj:
+async def login(user: schemas.UserLogin, db: DBSession = Depends(get_db)):
+    credentials = await run_crud(db, crud.get_user_credentials, user.email)
+    if not credentials:
         raise HTTPException(status_code=400, detail="Invalid credentials")
-    return {"message": "Login successful"}
+    user_id, hashed_password = credentials
+    valid, new_hash = await passwords.verify_password(user.password, hashed_password)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    # Transparently upgrade hashes made with an older cost or scheme
+    if new_hash:
+        await run_crud(db, crud.update_user_password_hash, user_id, new_hash)
+    return {"message": "Login successful", **tokens.issue_tokens(user_id)}
+
+# Bearer tokens are checked locally (signature, expiry, revocation list):
+# no database query and no password hashing per request.
+bearer_scheme = HTTPBearer(auto_error=False)
+
+def unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+async def require_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> dict:
+    if credentials is None:
+        raise unauthorized("Not authenticated")
+    try:
+        return tokens.decode(credentials.credentials)
+    except tokens.InvalidToken as exc:
+        raise unauthorized(str(exc))
+
+@app.post("/token/refresh")
+async def refresh_token(body: schemas.TokenRefresh, db: DBSession = Depends(get_db)):
+    try:
+        claims = tokens.decode(body.refresh_token, tokens.REFRESH)
+    except tokens.InvalidToken as exc:
+        raise unauthorized(str(exc))
+    # Refresh tokens are single-use on every worker: the token is claimed in
+    # the database before a new pair is issued.
+    if not await run_crud(db, crud.revoke_refresh_token, claims["jti"], claims["exp"]):
+        raise unauthorized("Token revoked")
+    return tokens.refresh(claims)
+
+@app.post("/logout", status_code=204)
+async def logout(
+    body: Optional[schemas.Logout] = None,
+    claims: dict = Depends(require_user),
+    db: DBSession = Depends(get_db),
+):
+    # Access tokens are revoked in this process only and expire within
+    # ACCESS_TOKEN_TTL; the refresh token is revoked for every worker.
+    tokens.revoke(claims)
+    if body and body.refresh_token:
+        try:
+            refresh_claims = tokens.decode(body.refresh_token, tokens.REFRESH)
+        except tokens.InvalidToken:
+            pass  # already unusable
+        else:
+            tokens.revoke(refresh_claims)
+            await run_crud(db, crud.revoke_refresh_token, refresh_claims["jti"], refresh_claims["exp"])
+    return Response(status_code=204)
 
 # Product CRUD Endpoints
 
+# Filters shared by the product listing and the facet counts. Repeat a
+# parameter to match any of several values (?tag=sale&tag=new).
+def product_filters(
+    tag: Optional[List[str]] = Query(None),
+    collection: Optional[List[str]] = Query(None),
+    market: Optional[List[str]] = Query(None),
+    sales_channel: Optional[List[str]] = Query(None),
+    vendor: Optional[List[str]] = Query(None),
+    product_type: Optional[List[str]] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+) -> dict:
+    filters = {
+        "tag": tag, "collection": collection, "market": market, "sales_channel": sales_channel,
+        "vendor": vendor, "product_type": product_type, "status": status,
+        "min_price": min_price, "max_price": max_price,
+    }
+    return {key: value for key, value in filters.items() if value is not None}
+
+def product_fields(
+    fields: Optional[str] = Query(None, description="Comma-separated subset of product fields, e.g. id,title,price")
+) -> List[str]:
+    if not fields:
+        return list(schemas.PRODUCT_FIELDS)
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in schemas.PRODUCT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    # The id is always returned; clients need it to address the product.
+    return names if "id" in names else ["id"] + names
+
 @app.get("/products/", response_model=List[schemas.Product], summary="Get all products")
-def read_products(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    return crud.get_products(db, skip=skip, limit=limit)
+async def read_products(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    fields: List[str] = Depends(product_fields),
+    filters: dict = Depends(product_filters),
+    db: DBSession = Depends(get_read_db)
+):
+    # `skip` is kept for older clients; everything else pages by cursor and
+    # gets the token for the following page in the X-Next-Cursor header.
+    #
+    # Only the requested columns are selected, as plain rows: they come
+    # straight from typed columns, so they are encoded with orjson as they
+    # are instead of being re-validated through response_model.
+    try:
+        sort_key, _ = pagination.parse_sort(sort)
+        # The sort key is read for the cursor even if it is not returned.
+        columns = crud.product_columns(fields + [sort_key])
+        next_cursor = None
+        if skip and not cursor:
+            rows = await run_crud(db, crud.get_products, skip=skip, limit=limit, sort=sort, filters=filters, columns=columns)
+        else:
+            rows, next_cursor = await run_crud(
+                db, crud.get_products_page, limit=limit, cursor=cursor, sort=sort, filters=filters, columns=columns
+            )
+    except pagination.InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return ORJSONResponse([dict(zip(fields, row)) for row in rows], headers=headers)
+
+@app.get("/products/facets", summary="Product counts per facet value")
+async def read_product_facets(
+    limit: int = Query(50, ge=1, le=500, description="values returned per facet"),
+    filters: dict = Depends(product_filters),
+    db: DBSession = Depends(get_read_db)
+):
+    return await run_crud(db, crud.get_facet_counts, filters=filters, limit=limit)
+
+@app.get("/products/analytics", summary="Catalog totals per vendor, product type, status and collection")
+async def read_product_analytics(
+    dimension: Optional[List[str]] = Query(None, description="vendor, product_type, status or collection (default: all)"),
+    db: DBSession = Depends(get_read_db)
+):
+    unknown = set(dimension or ()) - set(analytics.DIMENSIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown dimension: {', '.join(sorted(unknown))}")
+    return await run_crud(db, crud.get_product_summary, dimension)
+
+@app.get("/products/search", response_model=List[schemas.Product], summary="Full-text product search")
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    db: DBSession = Depends(get_read_db)
+):
+    # Matches title, SKU, tags and description; the last word may be partial.
+    return await run_crud(db, crud.search_products, q, limit=limit)
+
+# Bulk import / export
+
+# Only the first errors are echoed back; the count covers all of them.
+MAX_REPORTED_ERRORS = 1000
+
+@app.post("/products/bulk", summary="Bulk import products from NDJSON or CSV", dependencies=[Depends(require_user)])
+async def bulk_import_products(
+    request: Request,
+    format: Optional[str] = Query(None, description="ndjson or csv; defaults to the Content-Type"),
+    batch_size: int = Query(BULK_BATCH_SIZE, ge=1, le=10000),
+    db: DBSession = Depends(get_db)
+):
+    fmt = bulk.detect_format(request.headers.get("content-type"), format)
+    if not fmt:
+        raise HTTPException(status_code=415, detail="Send NDJSON (application/x-ndjson) or CSV (text/csv)")
+
+    inserted, failed, errors, batch = 0, 0, [], []
+
+    def report(row, detail):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": row, "errors": detail})
+
+    async def flush():
+        nonlocal inserted
+        failures = await run_crud(db, crud.bulk_create_products, batch)
+        inserted += len(batch) - len(failures)
+        for row, message in failures:
+            report(row, [{"msg": message}])
+        batch.clear()
+
+    async for row, values in bulk.parse_rows(request.stream(), fmt):
+        if isinstance(values, bulk.RowError):
+            report(values.row, values.errors)
+            continue
+        batch.append((row, values))
+        if len(batch) >= batch_size:
+            await flush()
+    await flush()
+    return {"inserted": inserted, "failed": failed, "errors": errors}
+
+@app.get("/products/export", summary="Stream all products as NDJSON or CSV")
+async def export_products(format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    # The request-scoped session is closed before a streamed body is sent, so
+    # the generator owns its own session for the lifetime of the stream.
+    def rows():
+        with ReadSessionLocal() as db:
+            yield from crud.iter_products(db, batch_size=EXPORT_BATCH_SIZE)
+
+    return StreamingResponse(
+        bulk.export_lines(rows(), format),
+        media_type=bulk.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'},
+    )
+
+@app.get("/products/changes", summary="Stream product changes as Server-Sent Events")
+async def product_changes(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0, description="Resume after this event id (or send Last-Event-ID)"),
+):
+    # Events carry the product id and version; clients refetch what they
+    # show. A `reset` event means the position is gone: reload the list.
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        if not last_event_id.isdigit():
+            raise HTTPException(status_code=400, detail="Last-Event-ID must be an event id")
+        since = int(last_event_id)
+    return StreamingResponse(
+        changefeed.stream(changefeed.feed, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/products/{product_id}", response_model=schemas.Product, summary="Get a product by ID")
-def read_product(product_id: int, db: Session = Depends(get_db)):
-    product = crud.get_product(db, product_id=product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
+async def read_product(product_id: int, request: Request, db: DBSession = Depends(get_db)):
+    # Misses are filled from the primary, not the replica: a lagging replica
+    # could return a version older than the last invalidation and the cache
+    # would keep it until the TTL. Hits never open a connection.
+    entry = product_cache.get(product_id)
+    if entry is None:
+        generation = product_cache.begin_fill()
+        product = await run_crud(db, crud.get_product, product_id=product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        entry = product_cache.put(product, generation)
+    # Clients may keep a copy but must revalidate it with If-None-Match
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(content=entry.data, headers=headers)
+
+@app.get("/cache/stats", summary="Product cache counters")
+async def cache_stats():
+    return product_cache.stats()
 
-@app.post("/products/", response_model=schemas.Product, summary="Create a new product")
-def create_product_endpoint(
+@app.post("/products/", response_model=schemas.Product, summary="Create a new product", dependencies=[Depends(require_user)])
+async def create_product_endpoint(
     title: str = Form(...),
     description: str = Form(...),
     price: float = Form(...),
     compare_at_price: Optional[float] = Form(None),
     cost_per_item: Optional[float] = Form(None),
-    profit: Optional[float] = Form(None),
-    margin: Optional[float] = Form(None),
     track_quantity: Optional[bool] = Form(None),
     status: Optional[str] = Form(None),
     sales_channels: Optional[str] = Form(None),
@@ -103,18 +419,11 @@ def create_product_endpoint(
     barcode: Optional[str] = Form(None),
     collections: Optional[str] = Form(None),
     tags: Optional[str] = Form(None),
+    inventory_quantity: Optional[int] = Form(None),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_db)
 ):
-    image_url = None
-    if image:
-        if not image.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="Uploaded file is not an image")
-        filename = f"{os.urandom(16).hex()}_{image.filename}"
-        file_location = os.path.join(UPLOAD_DIR, filename)
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        image_url = f"/images/{filename}"
+    stored = await store_image(image) if image else None
     
     product_data = schemas.ProductCreate(
         title=title,
@@ -122,8 +431,6 @@ def create_product_endpoint(
         price=price,
         compare_at_price=compare_at_price,
         cost_per_item=cost_per_item,
-        profit=profit,
-        margin=margin,
         track_quantity=track_quantity,
         status=status,
         sales_channels=sales_channels,
@@ -134,22 +441,22 @@ def create_product_endpoint(
         barcode=barcode,
         collections=collections,
         tags=tags,
-        image_url=image_url
+        inventory_quantity=inventory_quantity,
+        image_url=stored.url if stored else None
     )
     
-    product = crud.create_product(db=db, product=product_data)
+    async with storage.holding(db, stored):
+        product = await run_crud(db, crud.create_product, product=product_data)
     return product
 
-@app.put("/products/{product_id}", response_model=schemas.Product, summary="Update a product by ID")
-def update_product_endpoint(
+@app.put("/products/{product_id}", response_model=schemas.Product, summary="Update a product by ID", dependencies=[Depends(require_user)])
+async def update_product_endpoint(
     product_id: int,
     title: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
     price: Optional[float] = Form(None),
     compare_at_price: Optional[float] = Form(None),
     cost_per_item: Optional[float] = Form(None),
-    profit: Optional[float] = Form(None),
-    margin: Optional[float] = Form(None),
     track_quantity: Optional[bool] = Form(None),
     status: Optional[str] = Form(None),
     sales_channels: Optional[str] = Form(None),
@@ -160,58 +467,93 @@ def update_product_endpoint(
     barcode: Optional[str] = Form(None),
     collections: Optional[str] = Form(None),
     tags: Optional[str] = Form(None),
+    inventory_quantity: Optional[int] = Form(None),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_db)
 ):
-    product = crud.get_product(db, product_id=product_id)
+    product = await run_crud(db, crud.get_product, product_id=product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    image_url = product.image_url
-    if image:
-        if not image.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="Uploaded file is not an image")
-        if image_url:
-            old_image_path = image_url.lstrip("/")
-            if os.path.isfile(old_image_path):
-                os.remove(old_image_path)
-        filename = f"{os.urandom(16).hex()}_{image.filename}"
-        file_location = os.path.join(UPLOAD_DIR, filename)
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        image_url = f"/images/{filename}"
+    old_image_url = product.image_url
+    stored = await store_image(image) if image else None
+    image_url = stored.url if stored else old_image_url
     
-    updated_product = crud.update_product(
-        db=db, product_id=product_id, product=schemas.ProductCreate(
-            title=title or product.title,
-            description=description or product.description,
-            price=price or product.price,
-            compare_at_price=compare_at_price if compare_at_price is not None else product.compare_at_price,
-            cost_per_item=cost_per_item or product.cost_per_item,
-            profit=profit or product.profit,
-            margin=margin or product.margin,
-            track_quantity=track_quantity if track_quantity is not None else product.track_quantity,
-            status=status or product.status,
-            sales_channels=sales_channels or product.sales_channels,
-            markets=markets or product.markets,
-            product_type=product_type or product.product_type,
-            vendor=vendor or product.vendor,
-            sku=sku or product.sku,
-            barcode=barcode or product.barcode,
-            collections=collections or product.collections,
-            tags=tags or product.tags,
-            image_url=image_url
+    async with storage.holding(db, stored):
+        updated_product = await run_crud(
+            db, crud.update_product, product_id=product_id, product=schemas.ProductCreate(
+                title=title if title is not None else product.title,
+                description=description if description is not None else product.description,
+                price=price if price is not None else product.price,
+                compare_at_price=compare_at_price if compare_at_price is not None else product.compare_at_price,
+                cost_per_item=cost_per_item if cost_per_item is not None else product.cost_per_item,
+                track_quantity=track_quantity if track_quantity is not None else product.track_quantity,
+                status=status if status is not None else product.status,
+                sales_channels=sales_channels if sales_channels is not None else product.sales_channels,
+                markets=markets if markets is not None else product.markets,
+                product_type=product_type if product_type is not None else product.product_type,
+                vendor=vendor if vendor is not None else product.vendor,
+                sku=sku if sku is not None else product.sku,
+                barcode=barcode if barcode is not None else product.barcode,
+                collections=collections if collections is not None else product.collections,
+                tags=tags if tags is not None else product.tags,
+                inventory_quantity=inventory_quantity if inventory_quantity is not None else product.inventory_quantity,
+                image_url=image_url
+            )
         )
-    )
+        if updated_product is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+    if image_url != old_image_url:
+        await storage.release_image(db, old_image_url)
     return updated_product
 
-@app.delete("/products/{product_id}", response_model=schemas.Product, summary="Delete a product by ID")
-def delete_product_endpoint(product_id: int, db: Session = Depends(get_db)):
-    product = crud.delete_product(db=db, product_id=product_id)
+@app.patch("/products/", response_model=schemas.ProductBatchResult, summary="Update many products in one statement", dependencies=[Depends(require_user)])
+async def batch_patch_products_endpoint(batch: schemas.ProductBatchUpdate, db: DBSession = Depends(get_db)):
+    updates = [item.model_dump(exclude_unset=True) for item in batch.updates]
+    if len({item["id"] for item in updates}) != len(updates):
+        raise HTTPException(status_code=400, detail="Each product id may appear only once")
+    products, skipped = await run_crud(db, crud.batch_patch_products, updates)
+    return {"updated": products, "skipped": skipped}
+
+@app.patch("/products/{product_id}", response_model=schemas.Product, summary="Partially update a product by ID", dependencies=[Depends(require_user)])
+async def patch_product_endpoint(
+    product_id: int,
+    changes: schemas.ProductUpdate,
+    request: Request,
+    response: Response,
+    db: DBSession = Depends(get_db)
+):
+    values = changes.model_dump(exclude_unset=True)
+    body_version = values.pop("version", None)
+    if_match = request.headers.get("if-match")
+    expected_version = body_version
+    if if_match and if_match.strip() != "*":
+        expected_version = etag_version(if_match, product_id)
+        if expected_version is None:
+            raise HTTPException(status_code=412, detail="If-Match does not match the current product version")
+        if body_version is not None and body_version != expected_version:
+            raise HTTPException(status_code=400, detail="If-Match and body version disagree")
+
+    try:
+        if values:
+            product = await run_crud(db, crud.patch_product, product_id, values, expected_version)
+        else:
+            product = await run_crud(db, crud.get_product, product_id=product_id)
+            if product and expected_version is not None and product.version != expected_version:
+                raise crud.StaleProduct(product_id)
+    except crud.StaleProduct:
+        if if_match:
+            raise HTTPException(status_code=412, detail="If-Match does not match the current product version")
+        raise
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    response.headers["ETag"] = product_etag(product.id, product.version)
+    return product
+
+@app.delete("/products/{product_id}", response_model=schemas.Product, summary="Delete a product by ID", dependencies=[Depends(require_user)])
+async def delete_product_endpoint(product_id: int, db: DBSession = Depends(get_db)):
+    product = await run_crud(db, crud.delete_product, product_id=product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    if product.image_url:
-        image_path = product.image_url.lstrip("/")
-        if os.path.isfile(image_path):
-            os.remove(image_path)
+    await storage.release_image(db, product.image_url)
     return product
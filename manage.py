@@ -0,0 +1,53 @@
+# manage.py
+# Maintenance commands: python manage.py <command>
+import argparse
+import sys
+
+import crud
+from database import SessionLocal
+
+
+def backfill_facets(args):
+    with SessionLocal() as db:
+        total = crud.rebuild_product_facets(db, batch_size=args.batch_size)
+    print(f"Rebuilt facets for {total} products")
+
+
+def rebuild_summary(args):
+    with SessionLocal() as db:
+        total = crud.rebuild_product_summary(db)
+    print(f"Rebuilt {total} product_summary rows")
+
+
+def check_summary(args):
+    with SessionLocal() as db:
+        problems = crud.check_product_summary(db)
+    for problem in problems[:args.show]:
+        print("{dimension}={value!r} {measure}: stored {stored}, expected {expected}".format(**problem))
+    if problems:
+        print(f"{len(problems)} difference(s); run `python manage.py rebuild-summary` to repair")
+        sys.exit(1)
+    print("product_summary is consistent")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Product API maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    facets = commands.add_parser("backfill-facets", help="rebuild product_facets from the product string columns")
+    facets.add_argument("--batch-size", type=int, default=1000)
+    facets.set_defaults(func=backfill_facets)
+
+    rebuild = commands.add_parser("rebuild-summary", help="recompute product_summary from the products table")
+    rebuild.set_defaults(func=rebuild_summary)
+
+    check = commands.add_parser("check-summary", help="compare product_summary with recomputed totals")
+    check.add_argument("--show", type=int, default=20, help="differences to print")
+    check.set_defaults(func=check_summary)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# metrics.py
+# Request instrumentation: per-route latency histograms, SQL query counts and
+# DB time per request (from SQLAlchemy engine events), N+1 and slow-query
+# flags, and a Prometheus text exposition for GET /metrics.
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+
+import logs
+from config import N_PLUS_ONE_THRESHOLD, SLOW_QUERY_MS
+
+logger = logging.getLogger("metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Waiting for a pooled connection should normally take (almost) no time.
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+# Characters of SQL kept in slow-query / N+1 log lines
+STATEMENT_PREVIEW = 300
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate from the buckets, interpolating like histogram_quantile()."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative, lower = 0, 0.0
+        for upper, count in zip(self.buckets, self.counts):
+            if count and cumulative + count >= rank:
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = upper
+        return self.buckets[-1]
+
+    def copy(self) -> "Histogram":
+        clone = Histogram(self.buckets)
+        clone.counts, clone.count, clone.sum = self.counts[:], self.count, self.sum
+        return clone
+
+
+class RequestStats:
+    """SQL activity of the request being handled (see the engine hooks)."""
+
+    __slots__ = ("queries", "db_seconds", "slow_queries", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+        self.statements: Dict[str, int] = {}
+
+    def repeated_statement(self) -> Optional[Tuple[str, int]]:
+        """The most repeated statement if it crosses the N+1 threshold."""
+        if self.queries < N_PLUS_ONE_THRESHOLD:
+            return None
+        statement, count = max(self.statements.items(), key=lambda item: item[1])
+        return (statement, count) if count >= N_PLUS_ONE_THRESHOLD else None
+
+
+# Set by the middleware; crud code running in the threadpool or through
+# AsyncSession.run_sync sees the same object via the copied context.
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+class RouteMetrics:
+    __slots__ = ("latency", "statuses", "queries", "db_seconds", "slow_queries", "n_plus_one")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses: Dict[int, int] = {}
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+        self.n_plus_one = 0
+
+    def copy(self) -> "RouteMetrics":
+        clone = RouteMetrics()
+        clone.latency = self.latency.copy()
+        clone.statuses = dict(self.statuses)
+        clone.queries, clone.db_seconds = self.queries, self.db_seconds
+        clone.slow_queries, clone.n_plus_one = self.slow_queries, self.n_plus_one
+        return clone
+
+
+# (method, route template) -> RouteMetrics. Route templates rather than raw
+# paths keep the label set bounded.
+_routes: Dict[Tuple[str, str], RouteMetrics] = {}
+_lock = threading.Lock()
+# Queries run outside of any request (startup, background jobs)
+_background = RouteMetrics()
+# pool name -> (checkout wait histogram, checkout timeouts)
+_pool_waits: Dict[str, Tuple[Histogram, List[int]]] = {}
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, list]]]] = []
+
+
+def record_request(method: str, route: str, status: int, duration: float, stats: RequestStats) -> None:
+    with _lock:
+        metrics = _routes.get((method, route))
+        if metrics is None:
+            metrics = _routes[(method, route)] = RouteMetrics()
+        metrics.latency.observe(duration)
+        metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+        metrics.queries += stats.queries
+        metrics.db_seconds += stats.db_seconds
+        metrics.slow_queries += stats.slow_queries
+        repeated = stats.repeated_statement()
+        if repeated:
+            metrics.n_plus_one += 1
+    if repeated:
+        statement, count = repeated
+        logger.warning("possible N+1 query", extra={"fields": {
+            "method": method, "route": route, "count": count, "statement": statement[:STATEMENT_PREVIEW],
+        }})
+
+
+def record_pool_wait(pool: str, seconds: float, timed_out: bool = False) -> None:
+    """Called by the connection pools (database.py) after every checkout."""
+    with _lock:
+        entry = _pool_waits.get(pool)
+        if entry is None:
+            entry = _pool_waits[pool] = (Histogram(POOL_WAIT_BUCKETS), [0])
+        entry[0].observe(seconds)
+        if timed_out:
+            entry[1][0] += 1
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, str, list]]]) -> None:
+    """Add metrics computed at scrape time.
+
+    ``collector()`` yields ``(name, type, help, samples)`` where samples are
+    ``(labels_dict, value)`` pairs.
+    """
+    _collectors.append(collector)
+
+
+# SQLAlchemy engine hooks
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    slow = elapsed * 1000 >= SLOW_QUERY_MS
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        stats.slow_queries += slow
+        stats.statements[statement] = stats.statements.get(statement, 0) + 1
+    else:
+        with _lock:
+            _background.queries += 1
+            _background.db_seconds += elapsed
+            _background.slow_queries += slow
+    if slow:
+        logger.warning("slow query", extra={"fields": {
+            "duration_ms": round(elapsed * 1000, 2), "statement": statement[:STATEMENT_PREVIEW],
+        }})
+
+
+def _handle_error(context):
+    # after_cursor_execute does not fire for failed statements.
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine) -> None:
+    """Attach the query hooks to a sync Engine (or an AsyncEngine's sync_engine)."""
+    engine = getattr(engine, "sync_engine", engine)
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# ASGI middleware
+
+class MetricsMiddleware:
+    """Times every HTTP request and hands the result to the metrics and logs.
+
+    A plain ASGI middleware: unlike @app.middleware("http") it does not wrap
+    the response in an extra streaming layer.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            _current.reset(token)
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            record_request(scope["method"], route, status, duration, stats)
+            logs.log_request(scope["method"], scope["path"], route, status, duration, stats)
+
+
+# Prometheus text exposition
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _sample(name: str, labels: dict, value) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        return f"{name}{{{rendered}}} {value}"
+    return f"{name} {value}"
+
+
+def _family(lines: list, name: str, kind: str, help_text: str) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _histogram(lines: list, name: str, labels: dict, histogram: Histogram) -> None:
+    cumulative = 0
+    for upper, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+        cumulative += count
+        lines.append(_sample(f"{name}_bucket", dict(labels, le=upper), cumulative))
+    lines.append(_sample(f"{name}_sum", labels, histogram.sum))
+    lines.append(_sample(f"{name}_count", labels, histogram.count))
+
+
+def render() -> str:
+    with _lock:
+        routes = [(method, route, metrics.copy()) for (method, route), metrics in sorted(_routes.items())]
+        background = _background.copy()
+        pools = [(pool, wait.copy(), timeouts[0]) for pool, (wait, timeouts) in sorted(_pool_waits.items())]
+
+    lines: List[str] = []
+    _family(lines, "http_requests_total", "counter", "HTTP requests by route and status.")
+    for method, route, metrics in routes:
+        for status, count in sorted(metrics.statuses.items()):
+            lines.append(_sample("http_requests_total", {"method": method, "route": route, "status": status}, count))
+
+    _family(lines, "http_request_duration_seconds", "histogram", "Request latency by route.")
+    for method, route, metrics in routes:
+        _histogram(lines, "http_request_duration_seconds", {"method": method, "route": route}, metrics.latency)
+
+    _family(lines, "http_request_duration_quantile_seconds", "gauge",
+            "p50/p95/p99 request latency by route, estimated from the histogram.")
+    for method, route, metrics in routes:
+        for q in QUANTILES:
+            labels = {"method": method, "route": route, "quantile": q}
+            lines.append(_sample("http_request_duration_quantile_seconds", labels, round(metrics.latency.quantile(q), 6)))
+
+    counters = [
+        ("db_queries_total", "SQL statements executed.", "queries"),
+        ("db_query_seconds_total", "Time spent executing SQL.", "db_seconds"),
+        ("db_slow_queries_total", f"SQL statements slower than {SLOW_QUERY_MS:g} ms.", "slow_queries"),
+        ("db_n_plus_one_total", f"Requests running one statement {N_PLUS_ONE_THRESHOLD}+ times.", "n_plus_one"),
+    ]
+    for name, help_text, attribute in counters:
+        _family(lines, name, "counter", help_text)
+        for method, route, metrics in routes:
+            lines.append(_sample(name, {"method": method, "route": route}, getattr(metrics, attribute)))
+        if attribute != "n_plus_one":
+            lines.append(_sample(name, {"method": "", "route": "background"}, getattr(background, attribute)))
+
+    _family(lines, "db_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a pooled connection.")
+    for pool, wait, _ in pools:
+        _histogram(lines, "db_pool_checkout_wait_seconds", {"pool": pool}, wait)
+    _family(lines, "db_pool_checkout_timeouts_total", "counter", "Checkouts that gave up after DB_POOL_TIMEOUT.")
+    for pool, _, timeouts in pools:
+        lines.append(_sample("db_pool_checkout_timeouts_total", {"pool": pool}, timeouts))
+
+    _family(lines, "log_records_dropped_total", "counter", "Log records dropped because the queue was full.")
+    lines.append(_sample("log_records_dropped_total", {}, logs.queue_handler.dropped))
+
+    for collector in _collectors:
+        for name, kind, help_text, samples in collector():
+            _family(lines, name, kind, help_text)
+            for labels, value in samples:
+                lines.append(_sample(name, labels, value))
+    return "\n".join(lines) + "\n"
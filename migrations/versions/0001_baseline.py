@@ -0,0 +1,61 @@
+"""Baseline: users and products as created by the original create_all.
+
+Databases created before migrations existed already have this schema; mark
+them with `alembic stamp 0001` and then run `alembic upgrade head`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("email", sa.String()),
+        sa.Column("hashed_password", sa.String()),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_name", "users", ["name"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String()),
+        sa.Column("description", sa.String()),
+        sa.Column("category", sa.String()),
+        sa.Column("price", sa.Float()),
+        sa.Column("compare_at_price", sa.Float(), nullable=True),
+        sa.Column("cost_per_item", sa.Float()),
+        sa.Column("profit", sa.Float()),
+        sa.Column("margin", sa.Float()),
+        sa.Column("track_quantity", sa.Boolean()),
+        sa.Column("sku", sa.String()),
+        sa.Column("barcode", sa.String()),
+        sa.Column("status", sa.String()),
+        sa.Column("sales_channels", sa.String()),
+        sa.Column("markets", sa.String()),
+        sa.Column("product_type", sa.String()),
+        sa.Column("vendor", sa.String()),
+        sa.Column("collections", sa.String()),
+        sa.Column("tags", sa.String()),
+        sa.Column("image_url", sa.String(), nullable=True),
+    )
+    op.create_index("ix_products_id", "products", ["id"])
+    op.create_index("ix_products_title", "products", ["title"])
+
+
+def downgrade():
+    op.drop_table("products")
+    op.drop_table("users")
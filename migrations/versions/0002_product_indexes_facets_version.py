@@ -0,0 +1,110 @@
+"""Product version column, pagination/search indexes and product_facets.
+
+Everything models.py gained before migrations were introduced.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Copied rather than imported: a migration must keep doing what it did when
+# it was written, whatever facets.py looks like later.
+MULTI_VALUE_FACETS = {
+    "tag": "tags",
+    "collection": "collections",
+    "market": "markets",
+    "sales_channel": "sales_channels",
+}
+BATCH_SIZE = 1000
+
+# Must stay identical to models.product_search_vector() for the planner to
+# use the index.
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A')"
+    " || setweight(to_tsvector('simple', coalesce(sku, '')), 'A')"
+    " || setweight(to_tsvector('simple', coalesce(tags, '')), 'B')"
+    " || setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+
+def split_values(raw):
+    seen = []
+    for value in (raw or "").split(","):
+        value = value.strip()
+        if value and value not in seen:
+            seen.append(value)
+    return seen
+
+
+def backfill_facets(connection, facets_table):
+    columns = list(MULTI_VALUE_FACETS.values())
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.text(
+                f"SELECT id, {', '.join(columns)} FROM products WHERE id > :last_id ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": BATCH_SIZE},
+        ).all()
+        if not rows:
+            return
+        facet_rows = [
+            {"product_id": row.id, "facet": facet, "value": value}
+            for row in rows
+            for facet, column in MULTI_VALUE_FACETS.items()
+            for value in split_values(getattr(row, column))
+        ]
+        if facet_rows:
+            op.bulk_insert(facets_table, facet_rows)
+        last_id = rows[-1].id
+
+
+def upgrade():
+    with op.batch_alter_table("products") as batch:
+        batch.add_column(sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+    op.create_index("ix_products_image_url", "products", ["image_url"])
+    op.create_index("ix_products_title_id", "products", ["title", "id"])
+    op.create_index("ix_products_price_id", "products", ["price", "id"])
+    op.create_index("ix_products_status_id", "products", ["status", "id"])
+
+    facets_table = op.create_table(
+        "product_facets",
+        sa.Column("facet", sa.String(), primary_key=True),
+        sa.Column("value", sa.String(), primary_key=True),
+        sa.Column(
+            "product_id", sa.Integer(), sa.ForeignKey("products.id", ondelete="CASCADE"), primary_key=True
+        ),
+    )
+    op.create_index("ix_product_facets_product_id", "product_facets", ["product_id"])
+    if context.is_offline_mode():
+        # No rows to read when only printing SQL; run
+        # `python manage.py backfill-facets` after applying it.
+        op.execute("-- product_facets is filled by `python manage.py backfill-facets`")
+    else:
+        backfill_facets(op.get_bind(), facets_table)
+
+    if op.get_context().dialect.name == "postgresql":
+        op.execute(f"CREATE INDEX ix_products_search ON products USING gin (({SEARCH_VECTOR}))")
+        op.execute("CREATE SEQUENCE IF NOT EXISTS product_change_seq")
+
+
+def downgrade():
+    if op.get_context().dialect.name == "postgresql":
+        op.execute("DROP SEQUENCE IF EXISTS product_change_seq")
+        op.drop_index("ix_products_search", table_name="products")
+    op.drop_index("ix_product_facets_product_id", table_name="product_facets")
+    op.drop_table("product_facets")
+    op.drop_index("ix_products_status_id", table_name="products")
+    op.drop_index("ix_products_price_id", table_name="products")
+    op.drop_index("ix_products_title_id", table_name="products")
+    op.drop_index("ix_products_image_url", table_name="products")
+    with op.batch_alter_table("products") as batch:
+        batch.drop_column("version")
@@ -0,0 +1,64 @@
+"""Inventory quantity, server-computed profit/margin and product_summary.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# Same formulas as analytics.financials(); values entered by clients are
+# replaced.
+FINANCIALS = """
+UPDATE products SET
+    profit = CASE WHEN price IS NOT NULL AND cost_per_item IS NOT NULL
+        THEN price - cost_per_item END,
+    margin = CASE WHEN price IS NOT NULL AND cost_per_item IS NOT NULL AND price <> 0
+        THEN (price - cost_per_item) * 100 / price END
+"""
+MEASURES = """
+    count(products.id), count(products.margin), coalesce(sum(products.margin), 0.0),
+    coalesce(sum(products.inventory_quantity), 0),
+    coalesce(sum(products.inventory_quantity * products.cost_per_item), 0.0)
+"""
+SUMMARY = [
+    f"SELECT '{column}', {column}, {MEASURES} FROM products WHERE {column} IS NOT NULL GROUP BY {column}"
+    for column in ("vendor", "product_type", "status")
+] + [
+    f"SELECT 'collection', product_facets.value, {MEASURES} FROM products"
+    " JOIN product_facets ON product_facets.product_id = products.id"
+    " WHERE product_facets.facet = 'collection' GROUP BY product_facets.value"
+]
+
+
+def upgrade():
+    with op.batch_alter_table("products") as batch:
+        batch.add_column(sa.Column("inventory_quantity", sa.Integer(), nullable=True))
+    op.create_table(
+        "product_summary",
+        sa.Column("dimension", sa.String(), primary_key=True),
+        sa.Column("value", sa.String(), primary_key=True),
+        sa.Column("products", sa.Integer(), nullable=False),
+        sa.Column("priced", sa.Integer(), nullable=False),
+        sa.Column("margin_total", sa.Float(), nullable=False),
+        sa.Column("inventory", sa.BigInteger(), nullable=False),
+        sa.Column("stock_value", sa.Float(), nullable=False),
+    )
+    op.execute(FINANCIALS)
+    for select in SUMMARY:
+        op.execute(
+            "INSERT INTO product_summary (dimension, value, products, priced, margin_total, inventory, stock_value) "
+            + select
+        )
+
+
+def downgrade():
+    op.drop_table("product_summary")
+    with op.batch_alter_table("products") as batch:
+        batch.drop_column("inventory_quantity")
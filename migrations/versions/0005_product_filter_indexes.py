@@ -0,0 +1,23 @@
+"""Composite (vendor, id) and (product_type, id) indexes on products.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_products_vendor_id", "products", ["vendor", "id"])
+    op.create_index("ix_products_product_type_id", "products", ["product_type", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_products_product_type_id", table_name="products")
+    op.drop_index("ix_products_vendor_id", table_name="products")
@@ -1,11 +1,7 @@
-from sqlalchemy.ext.declarative import declarative_base
 from database import Base
-from sqlalchemy.orm import relationship
-from sqlalchemy import Boolean, Column, Integer, String, Float, Date
+from sqlalchemy import BigInteger, Boolean, Column, Integer, String, Float, Index, ForeignKey, func, text
 
 
-Base = declarative_base()
-
 class User(Base):
     __tablename__ = 'users'
 
@@ -23,6 +19,7 @@ class Product(Base):
     price = Column(Float)
     compare_at_price = Column(Float, nullable=True)
     cost_per_item = Column(Float)
+    # Computed from price and cost_per_item on every write (see analytics.py).
     profit = Column(Float)
     margin = Column(Float)
     track_quantity = Column(Boolean)
@@ -35,5 +32,83 @@ class Product(Base):
     vendor = Column(String)
     collections = Column(String)
     tags = Column(String)
-    image_url = Column(String, nullable=True)
-  
\ No newline at end of file
+    inventory_quantity = Column(Integer, nullable=True)
+    image_url = Column(String, nullable=True, index=True)  # shared by deduplicated uploads
+    # Bumped on every write; backs optimistic concurrency (ETag / If-Match).
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    # Composite indexes backing keyset pagination (see pagination.py).
+    __table_args__ = (
+        Index("ix_products_title_id", "title", "id"),
+        Index("ix_products_price_id", "price", "id"),
+        Index("ix_products_status_id", "status", "id"),
+        # Vendor and product type filters (see facets.py): an equality match
+        # on the column, then rows in id order for the default listing.
+        Index("ix_products_vendor_id", "vendor", "id"),
+        Index("ix_products_product_type_id", "product_type", "id"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
+
+def product_search_vector():
+    """Weighted tsvector over the searchable product text (Postgres only).
+
+    Search queries must use this exact expression so the planner can use the
+    GIN index below.
+    """
+    # Constants are inlined rather than bound: with server-side parameters
+    # (asyncpg) the expression would otherwise not match the index.
+    def weighted(column, weight):
+        return func.setweight(
+            func.to_tsvector(text("'simple'"), func.coalesce(column, text("''"))),
+            text(f"'{weight}'"),
+        )
+
+    return (
+        weighted(Product.title, "A")
+        .op("||")(weighted(Product.sku, "A"))
+        .op("||")(weighted(Product.tags, "B"))
+        .op("||")(weighted(Product.description, "C"))
+    )
+
+
+Index("ix_products_search", product_search_vector(), postgresql_using="gin").ddl_if(dialect="postgresql")
+
+class ProductFacet(Base):
+    """One tag / collection / market / sales channel value of a product.
+
+    Mirrors the comma-separated columns on Product (see facets.py); the
+    primary key doubles as the (facet, value) -> product lookup index.
+    """
+    __tablename__ = "product_facets"
+    facet = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+class RevokedToken(Base):
+    """A refresh token that was rotated or logged out, kept until it expires.
+
+    The in-process list in tokens.py only covers one worker; this table is
+    what makes a spent refresh token fail on all of them.
+    """
+    __tablename__ = "revoked_tokens"
+    jti = Column(String, primary_key=True)
+    expires_at = Column(BigInteger, nullable=False, index=True)  # Unix time
+
+class ProductSummary(Base):
+    """Running totals per vendor / product type / status / collection value.
+
+    Maintained by the crud write paths (see analytics.py); serves
+    GET /products/analytics without scanning products.
+    """
+    __tablename__ = "product_summary"
+    dimension = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    products = Column(Integer, nullable=False, default=0)
+    # Products with a margin (price and cost known); margin_total / priced
+    # is the average margin.
+    priced = Column(Integer, nullable=False, default=0)
+    margin_total = Column(Float, nullable=False, default=0.0)
+    inventory = Column(BigInteger, nullable=False, default=0)
+    # Sum of inventory_quantity * cost_per_item
+    stock_value = Column(Float, nullable=False, default=0.0)
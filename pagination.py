@@ -0,0 +1,111 @@
+import base64
+import json
+import math
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, tuple_
+
+import models
+
+# Columns the product list can be ordered by. Every key is paired with the
+# primary key as a tie-breaker and backed by a composite (column, id) index
+# on models.Product, so keyset pages can be served straight from the index.
+PRODUCT_SORT_KEYS = {
+    "id": models.Product.id,
+    "title": models.Product.title,
+    "price": models.Product.price,
+    "status": models.Product.status,
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def parse_sort(sort: str) -> Tuple[str, bool]:
+    """Split a sort spec like ``-price`` into ``("price", True)``."""
+    descending = sort.startswith("-")
+    key = sort.lstrip("-")
+    if key not in PRODUCT_SORT_KEYS:
+        raise InvalidCursor(f"Unsupported sort key '{key}'")
+    return key, descending
+
+
+def encode_cursor(sort: str, value: Any, last_id: int) -> str:
+    payload = json.dumps([sort, value, last_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if cursor_sort != sort:
+        raise InvalidCursor("Cursor was issued for a different sort order")
+    # The values end up in SQL comparisons, so they must have the column's
+    # type: a string against a numeric column would fail in the database
+    # (a 500) or compare by the database's cross-type rules.
+    if isinstance(last_id, bool) or not isinstance(last_id, int):
+        raise InvalidCursor("Malformed cursor")
+    key, _ = parse_sort(sort)
+    if value is not None and not _is_value_of(value, PRODUCT_SORT_KEYS[key].type.python_type):
+        raise InvalidCursor("Malformed cursor")
+    return value, last_id
+
+
+def _is_value_of(value: Any, python_type: type) -> bool:
+    if isinstance(value, bool):
+        return False
+    if python_type is float:
+        # JSON has one number type; whole floats may come back as ints.
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    return isinstance(value, python_type)
+
+
+def order_by(sort: str):
+    # NULLs sort after every other value (the Postgres default), so ascending
+    # lists them last and descending lists them first. Both directions then
+    # match a plain (column, id) B-tree index, scanned forwards or backwards.
+    key, descending = parse_sort(sort)
+    column, pk = PRODUCT_SORT_KEYS[key], models.Product.id
+    if key == "id":
+        return [pk.desc() if descending else pk.asc()]
+    if descending:
+        return [column.desc().nulls_first(), pk.desc()]
+    return [column.asc().nulls_last(), pk.asc()]
+
+
+def seek_filters(sort: str, cursor: Optional[str]) -> List[Any]:
+    """WHERE clauses that resume a listing right after ``cursor``.
+
+    Rows with a NULL sort value cannot be reached with a single row-value
+    comparison, so the remainder of the listing is split into at most two
+    index-friendly regions that are read one after the other.
+    """
+    if not cursor:
+        return [None]
+    key, descending = parse_sort(sort)
+    value, last_id = decode_cursor(cursor, sort)
+    column, pk = PRODUCT_SORT_KEYS[key], models.Product.id
+
+    if key == "id":
+        return [pk < last_id if descending else pk > last_id]
+    if descending:
+        if value is None:
+            return [and_(column.is_(None), pk < last_id), column.isnot(None)]
+        return [tuple_(column, pk) < tuple_(value, last_id)]
+    if value is None:
+        return [and_(column.is_(None), pk > last_id)]
+    return [tuple_(column, pk) > tuple_(value, last_id), column.is_(None)]
+
+
+def split_page(rows: list, limit: int, sort: str):
+    """Trim a ``limit + 1`` row fetch to one page and build its next cursor."""
+    products = rows[:limit]
+    if not products or len(rows) <= limit:
+        return products, None
+    last = products[-1]
+    key, _ = parse_sort(sort)
+    return products, encode_cursor(sort, getattr(last, key), last.id)
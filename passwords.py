@@ -0,0 +1,48 @@
+# passwords.py
+# bcrypt hashing on a dedicated, bounded thread pool. Keeping it off the
+# event loop and out of the shared threadpool means a burst of logins cannot
+# starve every other endpoint on the same process.
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from config import BCRYPT_ROUNDS, PASSWORD_HASH_QUEUE_LIMIT, PASSWORD_HASH_WORKERS
+
+# Hashes made with a different cost (or scheme) are reported as outdated by
+# needs_update() and upgraded on the next successful login.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_max_in_flight = PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT
+_in_flight = 0
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full; surfaced to clients as 503."""
+
+
+def queue_depth() -> int:
+    return _in_flight
+
+
+async def _submit(fn, *args):
+    # Only ever touched from the event loop thread, so no lock is needed.
+    global _in_flight
+    if _in_flight >= _max_in_flight:
+        raise PasswordHasherBusy()
+    _in_flight += 1
+    try:
+        return await asyncio.wrap_future(_executor.submit(fn, *args))
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _submit(pwd_context.hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Return ``(valid, new_hash)``; ``new_hash`` is set when the stored hash is outdated."""
+    return await _submit(pwd_context.verify_and_update, password, hashed_password)
@@ -1,6 +1,6 @@
 
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import List, Optional
 
 class UserRegister(BaseModel):
     name: str
@@ -11,12 +11,20 @@ class UserLogin(BaseModel):
     email: str
     password: str
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+class Logout(BaseModel):
+    # Optional: also revoke the refresh token issued with the access token
+    refresh_token: Optional[str] = None
+
 class ProductBase(BaseModel):
     title: str
     description: str
     price: float
     compare_at_price: Optional[float] = None
     cost_per_item: Optional[float] = None
+    # Computed by the server from price and cost_per_item; input is ignored.
     profit: Optional[float] = None
     margin: Optional[float] = None
     track_quantity: Optional[bool] = None
@@ -29,6 +37,7 @@ class ProductBase(BaseModel):
     barcode: Optional[str] = None
     collections: Optional[str] = None
     tags: Optional[str] = None
+    inventory_quantity: Optional[int] = None
     image_url: Optional[str] = None
     category: Optional[str] = None  # Make category optional
 
@@ -37,7 +46,54 @@ class ProductCreate(ProductBase):
     pass
 
 class Product(ProductBase):
+  model_config = ConfigDict(from_attributes=True)
+
   id: int
+  version: int = 1
+
+# Names accepted by ?fields= sparse fieldsets; each is a products column.
+PRODUCT_FIELDS = tuple(Product.model_fields)
+
+class ProductUpdate(BaseModel):
+    # Partial update: only fields present in the request body are written.
+    title: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    compare_at_price: Optional[float] = None
+    cost_per_item: Optional[float] = None
+    track_quantity: Optional[bool] = None
+    status: Optional[str] = None
+    sales_channels: Optional[str] = None
+    markets: Optional[str] = None
+    product_type: Optional[str] = None
+    vendor: Optional[str] = None
+    sku: Optional[str] = None
+    barcode: Optional[str] = None
+    collections: Optional[str] = None
+    tags: Optional[str] = None
+    inventory_quantity: Optional[int] = None
+    # image_url is not patchable: images are uploaded through PUT, which
+    # also releases the file the product pointed at before.
+    category: Optional[str] = None
+    # Expected current version; a mismatch is rejected with 409.
+    version: Optional[int] = None
+
+    @field_validator("title", "description", "price")
+    @classmethod
+    def required_when_present(cls, value):
+        # May be left out, but ProductBase requires these fields (the columns
+        # themselves are nullable), so an explicit null is a 422.
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
+class ProductBatchItem(ProductUpdate):
+    id: int
+
+class ProductBatchUpdate(BaseModel):
+    updates: List[ProductBatchItem] = Field(..., min_length=1, max_length=1000)
 
-class Config:
-     from_attributes = True  # Make sure you're using from_attributes instead of orm_mode
\ No newline at end of file
+class ProductBatchResult(BaseModel):
+    updated: List[Product]
+    # Ids that were not found or whose expected version did not match
+    skipped: List[int]
@@ -0,0 +1,146 @@
+# search.py
+# Product search with prefix matching and relevance ranking.
+#
+# On Postgres, queries run against a weighted tsvector expression backed by
+# a GIN index (models.product_search_vector). Elsewhere an in-process
+# inverted index is built from the table on first use and kept current by
+# the crud write paths.
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Field weights, mirroring the tsvector weights (A=title/sku, B=tags, C=description)
+FIELD_WEIGHTS = {"title": 3, "sku": 3, "tags": 2, "description": 1}
+SEARCH_FIELDS = tuple(FIELD_WEIGHTS)
+# Upper bound on index terms a single prefix may expand to
+MAX_PREFIX_EXPANSION = 200
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def tsquery_text(q: str) -> Optional[str]:
+    """Every term as a prefix, all required: ``wire:* & mou:*``."""
+    terms = tokenize(q)
+    return " & ".join(f"{term}:*" for term in terms) if terms else None
+
+
+def _get(product, field):
+    return product.get(field) if isinstance(product, dict) else getattr(product, field)
+
+
+class InvertedIndex:
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._terms: List[str] = []  # sorted, for prefix lookups
+        self._docs: Dict[int, Tuple[str, ...]] = {}
+        self._lock = threading.RLock()
+        self.built = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    def build(self, products: Iterable) -> None:
+        with self._lock:
+            self._postings, self._terms, self._docs = {}, [], {}
+            for product in products:
+                self._add(product)
+            self._terms = sorted(self._postings)
+            self.built = True
+
+    def upsert(self, products: Iterable) -> None:
+        with self._lock:
+            if not self.built:
+                return  # The eventual build reads the current rows.
+            for product in products:
+                self._remove(_get(product, "id"))
+                for term in self._add(product):
+                    insort(self._terms, term)
+
+    def remove(self, product_id: int) -> None:
+        with self._lock:
+            if self.built:
+                self._remove(product_id)
+
+    def _add(self, product) -> List[str]:
+        """Index one product; returns the terms that are new to the index."""
+        product_id = _get(product, "id")
+        weights: Dict[str, int] = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(_get(product, field)):
+                weights[term] = weights.get(term, 0) + weight
+        new_terms = []
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                new_terms.append(term)
+            postings[product_id] = weight
+        self._docs[product_id] = tuple(weights)
+        return new_terms
+
+    def _remove(self, product_id: int) -> None:
+        for term in self._docs.pop(product_id, ()):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                index = bisect_left(self._terms, term)
+                if index < len(self._terms) and self._terms[index] == term:
+                    del self._terms[index]
+
+    def _expand(self, prefix: str) -> List[str]:
+        start = bisect_left(self._terms, prefix)
+        matches = []
+        for term in self._terms[start:start + MAX_PREFIX_EXPANSION]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, q: str, limit: int = 20) -> List[int]:
+        """Ids of products matching every term (as a prefix), best first."""
+        terms = tokenize(q)
+        if not terms:
+            return []
+        with self._lock:
+            total = max(len(self._docs), 1)
+            per_term = []
+            for term in dict.fromkeys(terms):
+                scores: Dict[int, float] = {}
+                for expansion in self._expand(term):
+                    postings = self._postings[expansion]
+                    idf = math.log(1 + total / len(postings))
+                    # Exact matches outrank longer words sharing the prefix.
+                    boost = idf * (1.0 if expansion == term else 0.5)
+                    for product_id, weight in postings.items():
+                        score = weight * boost
+                        if score > scores.get(product_id, 0.0):
+                            scores[product_id] = score
+                if not scores:
+                    return []
+                per_term.append(scores)
+
+        per_term.sort(key=len)
+        candidates = per_term[0]
+        results = []
+        for product_id, score in candidates.items():
+            for other in per_term[1:]:
+                extra = other.get(product_id)
+                if extra is None:
+                    break
+                score += extra
+            else:
+                results.append((score, -product_id))
+        return [-negated_id for _, negated_id in heapq.nlargest(limit, results)]
+
+
+index = InvertedIndex()
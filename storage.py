@@ -0,0 +1,234 @@
+# storage.py
+# Content-addressed storage for product images.
+#
+# Uploads are streamed to disk in chunks while being hashed, then moved to
+# <UPLOAD_DIR>/<h[0:2]>/<h[2:4]>/<sha256><ext>, with <ext> taken from the
+# file's magic bytes (see IMAGE_TYPES). Identical images therefore share one
+# file, and a file is only removed once no product references it.
+#
+# Counting references and committing the product that adds one are not
+# atomic, so a release can count zero just before another request commits a
+# product using the same file. Both sides guard against that window: the
+# upload keeps a hard link to the file until its product row is committed
+# and puts the file back if it has gone (see holding()), and release_image
+# moves the file aside, counts again and moves it back if needed.
+import hashlib
+import os
+import shutil
+import uuid
+from contextlib import asynccontextmanager
+from typing import NamedTuple, Optional
+
+import anyio
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+
+import crud
+from async_crud import run_crud
+from config import MAX_FORM_FIELDS_BYTES, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, UPLOAD_DIR
+
+IMAGE_URL_PREFIX = "/images/"
+# The only formats accepted and served as images, by extension. SVG is left
+# out on purpose: it can carry scripts.
+IMAGE_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".gif": "image/gif", ".webp": "image/webp"}
+# Enough leading bytes to recognise any of them.
+_SNIFF_BYTES = 12
+_TMP_DIR = os.path.join(UPLOAD_DIR, ".tmp")
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class StoredImage(NamedTuple):
+    url: str
+    path: str
+    # This upload's own link to the file, kept until the product row that
+    # references ``url`` is committed.
+    copy: str
+
+
+def init_storage():
+    os.makedirs(_TMP_DIR, exist_ok=True)
+
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    """Extension (a key of IMAGE_TYPES) for a file starting with ``head``.
+
+    Decided from the file's magic bytes only; the client's file name and
+    declared content type are not trusted.
+    """
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def path_for_url(image_url: str) -> Optional[str]:
+    """Map an /images/... URL to its file, refusing anything outside UPLOAD_DIR."""
+    if not image_url or not image_url.startswith(IMAGE_URL_PREFIX):
+        return None
+    # Hidden entries (such as the .tmp staging directory) are never exposed.
+    if any(part.startswith(".") for part in image_url[len(IMAGE_URL_PREFIX):].split("/")):
+        return None
+    root = os.path.realpath(UPLOAD_DIR)
+    path = os.path.realpath(os.path.join(root, image_url[len(IMAGE_URL_PREFIX):]))
+    if os.path.commonpath([root, path]) != root or path == root:
+        return None
+    return path
+
+
+async def save_image(image: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredImage:
+    """Stream ``image`` into the store; write the product under holding()."""
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    extension = None
+    tmp_path = os.path.join(_TMP_DIR, uuid.uuid4().hex)
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as out:
+            while chunk := await image.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageTooLarge(f"Image exceeds the {max_bytes} byte limit")
+                if extension is None:
+                    head += chunk[:_SNIFF_BYTES]
+                    if len(head) >= _SNIFF_BYTES:
+                        extension = sniff_extension(head)
+                        if extension is None:
+                            raise InvalidImage("Only PNG, JPEG, GIF and WebP images are accepted")
+                digest.update(chunk)
+                await out.write(chunk)
+        if extension is None:
+            extension = sniff_extension(head)
+            if extension is None:
+                raise InvalidImage("Only PNG, JPEG, GIF and WebP images are accepted")
+
+        name = digest.hexdigest()
+        relative = f"{name[:2]}/{name[2:4]}/{name}{extension}"
+        final_path = os.path.join(UPLOAD_DIR, relative)
+        await anyio.to_thread.run_sync(_place, tmp_path, final_path)
+    except BaseException:
+        await anyio.to_thread.run_sync(_discard, tmp_path)
+        raise
+    # The temporary file stays as this upload's copy.
+    return StoredImage(IMAGE_URL_PREFIX + relative, final_path, tmp_path)
+
+
+@asynccontextmanager
+async def holding(db, stored: Optional[StoredImage]):
+    """Wrap the write that makes a product reference ``stored``.
+
+    If the write fails the image is released again, so a failed create or
+    update leaves no unreferenced file behind. If it succeeds, the file is
+    put back in case a release removed it before the row was committed.
+    """
+    if stored is None:
+        yield
+        return
+    try:
+        yield
+    except Exception:
+        await anyio.to_thread.run_sync(_discard, stored.copy)
+        await release_image(db, stored.url)
+        raise
+    await anyio.to_thread.run_sync(_place, stored.copy, stored.path)
+    await anyio.to_thread.run_sync(_discard, stored.copy)
+
+
+def _place(source: str, final_path: str):
+    """Make ``final_path`` a copy of ``source`` unless it already exists."""
+    if os.path.exists(final_path):
+        return
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    try:
+        os.link(source, final_path)
+    except FileExistsError:
+        pass
+    except OSError:
+        # No hard links on this filesystem: copy, then rename into place so
+        # readers never see a partial file.
+        partial = os.path.join(_TMP_DIR, uuid.uuid4().hex)
+        shutil.copyfile(source, partial)
+        os.replace(partial, final_path)
+
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def release_image(db, image_url: Optional[str]):
+    """Delete the file behind ``image_url`` once no product references it.
+
+    Call after the product row that used it has been changed or deleted.
+    """
+    if not image_url or await run_crud(db, crud.count_image_references, image_url):
+        return
+    path = path_for_url(image_url)
+    if not path:
+        return
+    # Moved aside rather than deleted: a product using the file may have
+    # been committed since the count.
+    aside = os.path.join(_TMP_DIR, uuid.uuid4().hex)
+    try:
+        await anyio.to_thread.run_sync(os.replace, path, aside)
+    except FileNotFoundError:
+        return
+    if await run_crud(db, crud.count_image_references, image_url):
+        await anyio.to_thread.run_sync(_place, aside, path)
+    await anyio.to_thread.run_sync(_discard, aside)
+
+
+class UploadSizeLimit:
+    """Refuse multipart bodies too large to hold an acceptable image.
+
+    save_image() only sees the upload after Starlette has parsed the whole
+    form and spooled the file. This ASGI middleware answers 413 straight
+    away when Content-Length is over the limit, and stops a chunked body as
+    soon as the bytes received pass it. Other bodies (bulk imports) are left
+    alone.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES + MAX_FORM_FIELDS_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        detail = f"Request body exceeds the {self.max_bytes} byte limit"
+        length = headers.get("content-length", "")
+        if length.isdigit() and int(length) > self.max_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Re-raised by FastAPI's form parsing and answered as 413.
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,115 @@
+import os
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# The application modules live at the repository root.
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# Settings shared by every test: fast bcrypt, quiet logs, a fixed JWT key.
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("ACCESS_LOG_SAMPLE_RATE", "0")
+os.environ.setdefault("JWT_SECRET", "test-secret-at-least-32-bytes-long")
+
+# Application modules read their settings from the environment at import
+# time, so each test imports them afresh against its own database. logs and
+# passwords start threads on import and do not depend on the database; they
+# are imported once.
+APP_MODULES = sorted(
+    path.stem for path in ROOT.glob("*.py") if path.stem not in ("__init__", "logs", "passwords", "gunicorn_conf")
+)
+
+
+@pytest.fixture(params=["sync", "async"])
+def db_mode(request):
+    return request.param
+
+
+@pytest.fixture
+def app(db_mode, tmp_path, monkeypatch):
+    """The main module, imported against an empty SQLite database in ``db_mode``."""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv("DB_MODE", db_mode)
+    monkeypatch.setenv("DB_AUTO_CREATE", "1")
+    monkeypatch.setenv("UPLOAD_DIR", str(tmp_path / "images"))
+    for name in ("DATABASE_REPLICA_URL", "SEARCH_BACKEND", "CHANGEFEED_BACKEND"):
+        monkeypatch.delenv(name, raising=False)
+    for name in APP_MODULES:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    import main
+
+    return main
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+
+    # Entering the client runs the lifespan hook, which creates the tables.
+    with TestClient(app.app) as client:
+        yield client
+
+
+@pytest.fixture
+def auth(client):
+    """Authorization header for a freshly registered user."""
+    credentials = {"email": "owner@example.com", "password": "correct horse"}
+    assert client.post("/register", json={"name": "Owner", **credentials}).status_code == 200
+    response = client.post("/login", json=credentials)
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def make_product(client, auth):
+    """Create a product through POST /products/ and return its JSON."""
+    def make(image=None, **fields):
+        data = {"title": "Widget", "description": "A widget", "price": 10.0, **fields}
+        files = {"image": image} if image else None
+        response = client.post("/products/", data=data, files=files, headers=auth)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return make
+
+
+@pytest.fixture
+def session(app):
+    """A sync session on the test database, whatever the app's DB_MODE."""
+    import database
+
+    db = database.SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def live_server(app):
+    """Base URL of the app served by uvicorn on a background thread.
+
+    Needed for streaming responses, which the test client buffers until they
+    end.
+    """
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app.app, host="127.0.0.1", port=port, log_config=None, lifespan="on"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError("test server did not start")
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(timeout=10)
@@ -0,0 +1,54 @@
+import pytest
+
+
+def summary(client, dimension):
+    response = client.get("/products/analytics", params={"dimension": dimension})
+    assert response.status_code == 200
+    return {row["value"]: row for row in response.json().get(dimension, [])}
+
+
+def test_summary_follows_every_write(client, auth, make_product, session):
+    import crud
+
+    lamp = make_product(vendor="Acme", collections="home,office", price=20.0, cost_per_item=15.0, inventory_quantity=4)
+    desk = make_product(vendor="Acme", collections="office", price=100.0, cost_per_item=50.0, inventory_quantity=1)
+    chair = make_product(vendor="Globex", price=40.0)
+
+    vendors = summary(client, "vendor")
+    assert vendors["Acme"]["products"] == 2
+    assert vendors["Acme"]["average_margin"] == pytest.approx((25.0 + 50.0) / 2)
+    assert vendors["Acme"]["inventory"] == 5
+    assert vendors["Acme"]["stock_value"] == pytest.approx(4 * 15.0 + 50.0)
+    assert vendors["Globex"]["average_margin"] is None  # no cost, no margin
+    assert {value: row["products"] for value, row in summary(client, "collection").items()} == {"office": 2, "home": 1}
+
+    client.patch(f"/products/{lamp['id']}", json={"vendor": "Globex", "cost_per_item": 10.0}, headers=auth)
+    client.patch("/products/", json={"updates": [
+        {"id": desk["id"], "collections": "home"},
+        {"id": chair["id"], "inventory_quantity": 3},
+    ]}, headers=auth)
+    client.put(f"/products/{desk['id']}", data={"price": "80"}, headers=auth)
+    client.delete(f"/products/{chair['id']}", headers=auth)
+
+    vendors = summary(client, "vendor")
+    assert {value: row["products"] for value, row in vendors.items()} == {"Acme": 1, "Globex": 1}
+    assert vendors["Globex"]["average_margin"] == pytest.approx(50.0)
+    assert vendors["Acme"]["average_margin"] == pytest.approx(37.5)
+    assert {value: row["products"] for value, row in summary(client, "collection").items()} == {"home": 2, "office": 1}
+    # The incremental totals match a recount of the products table.
+    assert crud.check_product_summary(session) == []
+
+
+def test_bulk_import_updates_summary(client, auth, session):
+    import crud
+
+    body = "\n".join('{"title": "t%d", "description": "d", "price": 10, "cost_per_item": 4, "vendor": "Acme"}' % i
+                     for i in range(5))
+    response = client.post("/products/bulk", content=body, headers={**auth, "Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200, response.text
+    assert summary(client, "vendor")["Acme"]["products"] == 5
+    assert crud.check_product_summary(session) == []
+
+
+def test_unknown_dimension(client):
+    assert client.get("/products/analytics", params={"dimension": "colour"}).status_code == 400
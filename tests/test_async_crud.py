@@ -0,0 +1,35 @@
+import inspect
+
+
+def test_async_counterparts_match_their_crud_function(app):
+    import async_crud
+
+    for fn, async_fn in async_crud.ASYNC_CRUD.items():
+        assert inspect.iscoroutinefunction(async_fn)
+        assert async_fn.__name__ == fn.__name__
+        assert list(inspect.signature(async_fn).parameters) == list(inspect.signature(fn).parameters)
+
+
+def test_unregistered_functions_run_on_the_session(app, db_mode):
+    import anyio
+
+    import async_crud
+    import database
+
+    def same_name_as_an_async_one(db):
+        return type(db).__name__
+
+    same_name_as_an_async_one.__name__ = "get_product"
+
+    async def call():
+        session_factory = database.AsyncSessionLocal or database.SessionLocal
+        db = session_factory()
+        try:
+            return await async_crud.run_crud(db, same_name_as_an_async_one)
+        finally:
+            if db_mode == "async":
+                await db.close()
+            else:
+                db.close()
+
+    assert anyio.run(call) == "Session"
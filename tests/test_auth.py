@@ -0,0 +1,97 @@
+NEW_PRODUCT = {"title": "Lamp", "description": "A lamp", "price": "10"}
+
+
+def login(client, email="owner@example.com", password="correct horse"):
+    return client.post("/login", json={"email": email, "password": password})
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_writes_need_a_token(client):
+    response = client.post("/products/", data=NEW_PRODUCT)
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+    assert client.post("/products/", data=NEW_PRODUCT, headers=bearer("not-a-jwt")).status_code == 401
+    assert client.get("/products/").status_code == 200  # reads stay public
+
+
+def test_login(client, auth):
+    assert login(client, password="wrong").status_code == 400
+    assert login(client, email="nobody@example.com").status_code == 400
+    tokens = login(client).json()
+    assert client.post("/products/", data=NEW_PRODUCT, headers=bearer(tokens["access_token"])).status_code == 200
+    # A refresh token is not an access token.
+    assert client.post("/products/", data=NEW_PRODUCT, headers=bearer(tokens["refresh_token"])).status_code == 401
+
+
+def test_refresh_rotates_the_refresh_token(client, auth):
+    old = login(client).json()
+    response = client.post("/token/refresh", json={"refresh_token": old["refresh_token"]})
+    assert response.status_code == 200
+    new = response.json()
+    assert client.post("/products/", data=NEW_PRODUCT, headers=bearer(new["access_token"])).status_code == 200
+    assert client.post("/token/refresh", json={"refresh_token": old["refresh_token"]}).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": old["access_token"]}).status_code == 401
+
+
+def test_logout_revokes_tokens(client, auth):
+    tokens = login(client).json()
+    headers = bearer(tokens["access_token"])
+    assert client.post("/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers).status_code == 204
+    assert client.post("/products/", data=NEW_PRODUCT, headers=headers).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    # Other sessions of the same user are unaffected.
+    assert client.post("/products/", data=NEW_PRODUCT, headers=auth).status_code == 200
+
+
+def test_expired_token(client, auth, monkeypatch):
+    import tokens
+
+    monkeypatch.setattr(tokens, "ACCESS_TOKEN_TTL", -1)
+    expired = login(client).json()["access_token"]
+    assert client.post("/products/", data=NEW_PRODUCT, headers=bearer(expired)).status_code == 401
+
+
+def test_spent_refresh_tokens_fail_on_other_workers(client, auth, monkeypatch):
+    import tokens
+
+    rotated, logged_out = login(client).json(), login(client).json()
+    client.post("/token/refresh", json={"refresh_token": rotated["refresh_token"]}).raise_for_status()
+    client.post("/logout", json={"refresh_token": logged_out["refresh_token"]},
+                headers=bearer(logged_out["access_token"]))
+    # Another worker has its own, empty in-process revocation list.
+    monkeypatch.setattr(tokens, "revoked", tokens.RevocationList(tokens.TOKEN_REVOCATION_LIMIT))
+    assert client.post("/token/refresh", json={"refresh_token": rotated["refresh_token"]}).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": logged_out["refresh_token"]}).status_code == 401
+
+
+def test_busy_password_hasher_is_a_503(client, auth, monkeypatch):
+    import passwords
+
+    monkeypatch.setattr(passwords, "_in_flight", passwords._max_in_flight)
+    for response in (login(client), client.post("/register", json={"name": "B", "email": "b@example.com", "password": "pw"})):
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    monkeypatch.undo()
+    assert login(client).status_code == 200
+
+
+def test_outdated_hash_is_upgraded_on_login(client, session):
+    import models
+    import passwords
+    from passlib.context import CryptContext
+
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=passwords.BCRYPT_ROUNDS + 1).hash("correct horse")
+    session.add(models.User(name="Old", email="old@example.com", hashed_password=old_hash))
+    session.commit()
+
+    assert login(client, email="old@example.com", password="wrong").status_code == 400
+    assert session.query(models.User.hashed_password).scalar() == old_hash  # only a valid login upgrades
+
+    assert login(client, email="old@example.com").status_code == 200
+    new_hash = session.query(models.User.hashed_password).scalar()
+    assert new_hash != old_hash
+    assert not passwords.pwd_context.needs_update(new_hash)
+    assert login(client, email="old@example.com").status_code == 200
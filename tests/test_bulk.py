@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+def ndjson(*rows):
+    return "\n".join(row if isinstance(row, str) else json.dumps(row) for row in rows)
+
+
+def product(title, **fields):
+    return {"title": title, "description": "d", "price": 10.0, **fields}
+
+
+def test_import_reports_bad_rows_and_keeps_the_rest(client, auth, session):
+    import crud
+
+    body = ndjson(
+        product("one", vendor="Acme"),
+        {"title": "no price", "description": "d"},
+        "{not json",
+        product("too many", inventory_quantity=2 ** 70),  # valid, but refused by the database
+        product("two", vendor="Acme"),
+    )
+    response = client.post("/products/bulk", content=body, headers={**auth, **NDJSON}, params={"batch_size": 10})
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["inserted"], result["failed"]) == (2, 3)
+    assert [error["row"] for error in result["errors"]] == [2, 3, 4]
+    assert result["errors"][0]["errors"][0]["loc"] == ["price"]
+    assert "Invalid JSON" in result["errors"][1]["errors"][0]["msg"]
+
+    titles = [item["title"] for item in client.get("/products/").json()]
+    assert titles == ["one", "two"]
+    # Rows dropped by the fallback leave no trace in the summary.
+    assert crud.check_product_summary(session) == []
+
+
+def test_import_csv(client, auth):
+    body = "title,description,price,tags\nLamp,\"A lamp,\nwith a newline\",12.5,home\nDesk,A desk,80,\n"
+    response = client.post("/products/bulk", content=body, headers={**auth, "Content-Type": "text/csv"})
+    assert response.json() == {"inserted": 2, "failed": 0, "errors": []}
+    lamp, desk = client.get("/products/").json()
+    assert lamp["description"] == "A lamp,\nwith a newline"
+    assert desk["tags"] is None
+
+    response = client.post("/products/bulk", content="title,colour\nx,red\n", headers={**auth, "Content-Type": "text/csv"})
+    assert response.json()["errors"][0]["row"] == 0
+
+
+def test_import_needs_a_known_format(client, auth):
+    response = client.post("/products/bulk", content="x", headers={**auth, "Content-Type": "text/plain"})
+    assert response.status_code == 415
+    assert client.post("/products/bulk", content="", headers=NDJSON).status_code == 401
+
+
+def test_export(client, auth):
+    client.post("/products/bulk", content=ndjson(*[product(f"p{i}", tags="a,b") for i in range(5)]),
+                headers={**auth, **NDJSON}, params={"batch_size": 2})
+
+    response = client.get("/products/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert 'filename="products.ndjson"' in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [(row["id"], row["title"], row["tags"]) for row in rows] == [(i + 1, f"p{i}", "a,b") for i in range(5)]
+
+    response = client.get("/products/export", params={"format": "csv"})
+    assert response.headers["content-type"].startswith("text/csv")
+    records = list(csv.DictReader(io.StringIO(response.text)))
+    assert [record["title"] for record in records] == [f"p{i}" for i in range(5)]
+    assert records[0]["id"] == "1"
+
+    assert client.get("/products/export", params={"format": "xml"}).status_code == 422
@@ -0,0 +1,91 @@
+def test_get_is_served_from_cache(client, make_product):
+    product = make_product()
+    url = f"/products/{product['id']}"
+    first, second = client.get(url), client.get(url)
+    assert first.json() == second.json()
+    assert first.headers["ETag"] == second.headers["ETag"] == f'"{product["id"]}-1"'
+    stats = client.get("/cache/stats").json()
+    assert (stats["misses"], stats["hits"]) == (1, 1)
+
+
+def test_conditional_get(client, make_product):
+    product = make_product()
+    url = f"/products/{product['id']}"
+    etag = client.get(url).headers["ETag"]
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert client.get(url, headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_writes_invalidate_cached_products(client, auth, make_product):
+    product = make_product(title="Old")
+    url = f"/products/{product['id']}"
+    etag = client.get(url).headers["ETag"]
+
+    client.patch(url, json={"title": "Patched"}, headers=auth)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "Patched"
+
+    client.patch("/products/", json={"updates": [{"id": product["id"], "title": "Batched"}]}, headers=auth)
+    assert client.get(url).json()["title"] == "Batched"
+
+    client.put(url, data={"title": "Put"}, headers=auth)
+    assert client.get(url).json()["title"] == "Put"
+
+    client.delete(url, headers=auth)
+    assert client.get(url).status_code == 404
+
+
+def test_fill_started_before_invalidation_is_dropped(client, make_product):
+    import crud
+    import database
+    from cache import product_cache
+
+    product_id = make_product()["id"]
+    generation = product_cache.begin_fill()
+    with database.SessionLocal() as db:
+        row = crud.get_product(db, product_id)
+    product_cache.invalidate(product_id)  # a write landed while the row was read
+    entry = product_cache.put(row, generation)
+    assert entry.data["id"] == product_id  # still answers the request that read it
+    assert product_cache.get(product_id) is None
+
+    product_cache.put(row, product_cache.begin_fill())
+    assert product_cache.get(product_id) is not None
+
+
+def test_change_feed_deliveries_invalidate(client, make_product):
+    import changefeed
+    from cache import product_cache
+
+    product_id = make_product()["id"]
+    client.get(f"/products/{product_id}")
+    assert product_cache.get(product_id) is not None
+    # What another worker's write looks like when it arrives through the feed.
+    changefeed.feed.deliver([changefeed.Event(1000, changefeed.UPDATED, product_id, 2)])
+    assert product_cache.get(product_id) is None
+
+
+def test_cache_is_not_filled_from_a_lagging_replica(client, auth, make_product, monkeypatch, tmp_path):
+    import shutil
+
+    import database
+    from sqlalchemy import create_engine
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    product = make_product(title="Old")
+    # The replica is a copy of the database taken before the PATCH below.
+    replica = tmp_path / "replica.db"
+    shutil.copy(tmp_path / "test.db", replica)
+    monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(bind=create_engine(f"sqlite:///{replica}")))
+    if database.AsyncReadSessionLocal is not None:
+        monkeypatch.setattr(database, "AsyncReadSessionLocal", async_sessionmaker(
+            create_async_engine(f"sqlite+aiosqlite:///{replica}"), expire_on_commit=False))
+
+    client.patch(f"/products/{product['id']}", json={"title": "New"}, headers=auth).raise_for_status()
+    assert client.get(f"/products/{product['id']}").json()["title"] == "New"
+    assert client.get(f"/products/{product['id']}").json()["title"] == "New"
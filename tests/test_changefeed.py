@@ -0,0 +1,80 @@
+import json
+
+import httpx
+import pytest
+
+CREDENTIALS = {"email": "feed@example.com", "password": "correct horse"}
+
+
+@pytest.fixture
+def http(live_server):
+    with httpx.Client(base_url=live_server, timeout=10) as http:
+        http.post("/register", json={"name": "Feed", **CREDENTIALS}).raise_for_status()
+        token = http.post("/login", json=CREDENTIALS).json()["access_token"]
+        http.headers["Authorization"] = f"Bearer {token}"
+        yield http
+
+
+def read_events(lines, count):
+    """The next ``count`` events from an SSE line iterator, as dicts."""
+    events, event = [], {}
+    for line in lines:
+        if line.startswith(":") or line.startswith("retry:"):
+            continue
+        if not line:
+            if event:
+                events.append(event)
+                event = {}
+                if len(events) == count:
+                    return events
+            continue
+        field, _, value = line.partition(": ")
+        event[field] = json.loads(value) if field == "data" else value
+    raise AssertionError(f"stream ended after {len(events)} events")
+
+
+def subscribe(http, **headers):
+    """Open the feed and wait until the server has registered the client."""
+    stream = http.stream("GET", "/products/changes", headers=headers)
+    response = stream.__enter__()
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    lines = response.iter_lines()
+    assert next(lines) == "retry: 2000"  # sent once subscribed
+    return stream, lines
+
+
+def test_stream_and_resume(http):
+    stream, lines = subscribe(http)
+    try:
+        product_id = http.post("/products/", data={"title": "t", "description": "d", "price": "1"}).json()["id"]
+        http.patch(f"/products/{product_id}", json={"title": "new"}).raise_for_status()
+        http.delete(f"/products/{product_id}").raise_for_status()
+        events = read_events(lines, 3)
+    finally:
+        stream.__exit__(None, None, None)
+
+    assert [event["event"] for event in events] == ["product.created", "product.updated", "product.deleted"]
+    assert [event["data"] for event in events] == [
+        {"id": product_id, "version": 1}, {"id": product_id, "version": 2}, {"id": product_id},
+    ]
+    ids = [int(event["id"]) for event in events]
+    assert ids == sorted(ids)
+
+    # Reconnecting with Last-Event-ID replays what was missed.
+    stream, lines = subscribe(http, **{"Last-Event-ID": str(ids[0])})
+    try:
+        replayed = read_events(lines, 2)
+    finally:
+        stream.__exit__(None, None, None)
+    assert [int(event["id"]) for event in replayed] == ids[1:]
+
+
+def test_unknown_position_resets(http):
+    stream, lines = subscribe(http, **{"Last-Event-ID": "999999"})
+    try:
+        (event,) = read_events(lines, 1)
+    finally:
+        stream.__exit__(None, None, None)
+    assert event["event"] == "reset"
+    assert http.get("/products/changes", headers={"Last-Event-ID": "abc"}).status_code == 400
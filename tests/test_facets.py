@@ -0,0 +1,57 @@
+def titles(client, **params):
+    response = client.get("/products/", params={"sort": "title", **params})
+    assert response.status_code == 200
+    return [product["title"] for product in response.json()]
+
+
+def facets(client, **params):
+    response = client.get("/products/facets", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def catalog(make_product):
+    make_product(title="Lamp", tags="sale, new", collections="home", vendor="Acme", price=20.0)
+    make_product(title="Desk", tags="sale", collections="home,office", vendor="Globex", price=80.0)
+    make_product(title="Pen", tags="new,new", collections="office", vendor="Acme", status="draft", price=2.0)
+
+
+def test_filters(client, make_product):
+    catalog(make_product)
+    assert titles(client, tag="sale") == ["Desk", "Lamp"]
+    # Several values for one facet match any of them ...
+    assert titles(client, tag=["sale", "new"]) == ["Desk", "Lamp", "Pen"]
+    # ... and different facets must all match.
+    assert titles(client, tag="new", collection="office") == ["Pen"]
+    assert titles(client, collection="home", vendor="Acme") == ["Lamp"]
+    assert titles(client, collection="office", max_price=50) == ["Pen"]
+    assert titles(client, tag="missing") == []
+
+
+def test_facet_counts(client, make_product):
+    catalog(make_product)
+    counts = facets(client)
+    # Values are trimmed and counted once per product, most common first.
+    assert counts["tag"] == {"new": 2, "sale": 2}
+    assert list(counts["collection"].items()) == [("home", 2), ("office", 2)]
+    assert counts["vendor"] == {"Acme": 2, "Globex": 1}
+    assert counts["status"] == {"draft": 1}
+    assert counts["market"] == {}
+
+    # Counts cover the products matching the filters.
+    counts = facets(client, tag="sale")
+    assert counts["collection"] == {"home": 2, "office": 1}
+    assert counts["vendor"] == {"Acme": 1, "Globex": 1}
+    assert list(facets(client, limit=1)["vendor"]) == ["Acme"]
+
+
+def test_facets_follow_writes(client, auth, make_product):
+    catalog(make_product)
+    lamp = client.get("/products/", params={"tag": "sale", "vendor": "Acme"}).json()[0]
+    client.patch(f"/products/{lamp['id']}", json={"tags": "clearance"}, headers=auth).raise_for_status()
+    assert titles(client, tag="sale") == ["Desk"]
+    assert titles(client, tag="clearance") == ["Lamp"]
+
+    client.delete(f"/products/{lamp['id']}", headers=auth)
+    assert facets(client)["tag"] == {"new": 1, "sale": 1}
+    assert facets(client)["collection"] == {"home": 1, "office": 2}
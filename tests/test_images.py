@@ -0,0 +1,208 @@
+import os
+
+import anyio
+import pytest
+
+PNG = ("photo.png", b"\x89PNG\r\n\x1a\nfirst image", "image/png")
+OTHER_PNG = ("other.png", b"\x89PNG\r\n\x1a\nsecond image", "image/png")
+
+
+def stored_files(root):
+    return sorted(
+        os.path.relpath(os.path.join(directory, name), root)
+        for directory, _, names in os.walk(root)
+        for name in names
+    )
+
+
+@pytest.fixture
+def image_root(app):
+    import config
+
+    return config.UPLOAD_DIR
+
+
+def test_upload_is_served(client, make_product):
+    product = make_product(image=PNG)
+    assert product["image_url"].startswith("/images/")
+    response = client.get(product["image_url"])
+    assert response.status_code == 200
+    assert response.content == PNG[1]
+    assert response.headers["content-type"] == "image/png"
+
+
+def test_upload_is_served_with_security_headers(client, make_product):
+    product = make_product(image=PNG)
+    response = client.get(product["image_url"])
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+    assert "sandbox" in response.headers["Content-Security-Policy"]
+    assert "Content-Disposition" not in response.headers
+
+
+@pytest.mark.parametrize("upload", [
+    ("notes.txt", b"hello", "text/plain"),
+    ("x.html", b"<html><script>alert(1)</script></html>", "image/png"),
+    ("x.svg", b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>', "image/svg+xml"),
+])
+def test_rejects_anything_but_known_image_formats(client, auth, image_root, upload):
+    response = client.post(
+        "/products/", data={"title": "t", "description": "d", "price": "1"},
+        files={"image": upload}, headers=auth,
+    )
+    assert response.status_code == 400
+    assert stored_files(image_root) == []
+
+
+@pytest.mark.parametrize("data, extension, content_type", [
+    (b"\xff\xd8\xff\xe0jpeg data", ".jpg", "image/jpeg"),
+    (b"GIF89a gif data", ".gif", "image/gif"),
+    (b"RIFF\x10\x00\x00\x00WEBPVP8 data", ".webp", "image/webp"),
+])
+def test_extension_comes_from_the_content(client, make_product, data, extension, content_type):
+    # The client's file name and declared type are ignored.
+    product = make_product(image=("page.html", data, "text/html"))
+    assert product["image_url"].endswith(extension)
+    assert client.get(product["image_url"]).headers["content-type"] == content_type
+
+
+def test_other_stored_files_are_downloads(client, image_root):
+    # Uploads from before the allow-list kept the client's extension.
+    os.makedirs(os.path.join(image_root, "legacy"))
+    with open(os.path.join(image_root, "legacy", "page.html"), "wb") as out:
+        out.write(b"<script>alert(1)</script>")
+    response = client.get("/images/legacy/page.html")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["Content-Disposition"] == "attachment"
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+
+
+@pytest.fixture
+def upload_limit(monkeypatch):
+    # Read when the app is imported, so request this before ``client``.
+    monkeypatch.setenv("MAX_UPLOAD_BYTES", "1000")
+    monkeypatch.setenv("MAX_FORM_FIELDS_BYTES", "1000")
+    return 2000
+
+
+def multipart(image):
+    boundary = "limit-test"
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="big.png"\r\n'
+        f"Content-Type: image/png\r\n\r\n"
+    ).encode() + image + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def test_oversized_upload_is_refused_before_parsing(upload_limit, client, auth, make_product, image_root, monkeypatch):
+    from starlette.requests import Request
+
+    def no_parsing(*args, **kwargs):
+        raise AssertionError("the form was parsed")
+
+    product = make_product()
+    body, headers = multipart(PNG[1] + b"\0" * upload_limit)
+    monkeypatch.setattr(Request, "form", no_parsing)
+    response = client.put(f"/products/{product['id']}", content=body, headers={**auth, **headers})
+    assert response.status_code == 413
+    assert stored_files(image_root) == []
+
+
+def test_oversized_chunked_upload_is_cut_off(upload_limit, app, client, auth, make_product, image_root):
+    product = make_product()
+    body, headers = multipart(PNG[1] + b"\0" * 10 * upload_limit)
+    # The test client reads the whole request up front, so talk ASGI directly.
+    chunks = [body[start:start + 500] for start in range(0, len(body), 500)]
+    received, sent = [], []
+
+    async def receive():
+        received.append(chunks[len(received)])
+        return {"type": "http.request", "body": received[-1], "more_body": len(received) < len(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "PUT", "scheme": "http",
+        "path": f"/products/{product['id']}", "raw_path": b"", "query_string": b"", "root_path": "",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in {**auth, **headers}.items()],
+        "client": ("127.0.0.1", 1), "server": ("testserver", 80),
+    }
+    anyio.run(app.app, scope, receive, send)
+    assert sent[0]["status"] == 413
+    assert len(received) <= upload_limit // 500 + 1  # reading stopped at the limit
+    assert stored_files(image_root) == []
+
+    # Uploads within the limit still work.
+    body, headers = multipart(PNG[1])
+    response = client.put(f"/products/{product['id']}", content=body, headers={**auth, **headers})
+    assert response.status_code == 200
+
+
+def test_identical_uploads_share_a_file(client, auth, make_product, image_root):
+    first, second = make_product(image=PNG), make_product(image=PNG)
+    assert first["image_url"] == second["image_url"]
+    assert len(stored_files(image_root)) == 1
+
+    client.delete(f"/products/{first['id']}", headers=auth)
+    assert client.get(second["image_url"]).status_code == 200
+    client.delete(f"/products/{second['id']}", headers=auth)
+    assert stored_files(image_root) == []
+
+
+def test_replacing_an_image_releases_the_old_one(client, auth, make_product, image_root):
+    product = make_product(image=PNG)
+    response = client.put(f"/products/{product['id']}", files={"image": OTHER_PNG}, headers=auth)
+    assert response.status_code == 200
+    assert response.json()["image_url"] != product["image_url"]
+    assert stored_files(image_root) == [response.json()["image_url"][len("/images/"):]]
+
+
+def test_failed_create_releases_its_upload(client, auth, make_product, image_root, monkeypatch):
+    import crud
+
+    kept = make_product(image=PNG)
+
+    def failing_write(db, *args, **kwargs):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(crud, "create_product", failing_write)
+    for image in (OTHER_PNG, PNG):
+        with pytest.raises(RuntimeError):
+            client.post("/products/", data={"title": "t", "description": "d", "price": "1"},
+                        files={"image": image}, headers=auth)
+    # The new file is gone; the one another product uses is not.
+    assert stored_files(image_root) == [kept["image_url"][len("/images/"):]]
+
+
+def test_failed_update_releases_its_upload(client, auth, make_product, image_root):
+    product = make_product()
+    client.delete(f"/products/{product['id']}", headers=auth)
+    response = client.put(f"/products/{product['id']}", files={"image": PNG}, headers=auth)
+    assert response.status_code == 404
+    assert stored_files(image_root) == []
+
+
+def test_upload_restores_file_released_before_its_commit(make_product):
+    import storage
+
+    first = make_product(image=PNG)
+    path = storage.path_for_url(first["image_url"])
+    # A release that counted no references moved the file away just before
+    # another product using the same image was committed.
+    os.remove(path)
+    second = make_product(image=PNG)
+    assert second["image_url"] == first["image_url"]
+    assert os.path.exists(path)
+
+
+def test_release_keeps_file_referenced_after_its_count(make_product, monkeypatch):
+    import crud
+    import storage
+
+    url = make_product(image=PNG)["image_url"]
+    # First count: no product yet; second count: one was committed meanwhile.
+    counts = iter([0, 1])
+    monkeypatch.setattr(crud, "count_image_references", lambda db, image_url: next(counts))
+    anyio.run(storage.release_image, None, url)
+    assert os.path.exists(storage.path_for_url(url))
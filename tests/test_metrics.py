@@ -0,0 +1,84 @@
+import re
+
+import pytest
+
+SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def scrape(client):
+    """``{(name, frozenset(labels.items())): value}`` from GET /metrics."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = {}
+    for line in response.text.splitlines():
+        if line.startswith("#"):
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        samples[(name, frozenset(LABEL.findall(labels or "")))] = float(value)
+    return samples
+
+
+def sample(samples, name, **labels):
+    return samples[(name, frozenset((key, str(value)) for key, value in labels.items()))]
+
+
+def test_requests_are_counted_per_route_template(client, make_product):
+    first, second = make_product(), make_product()
+    client.get(f"/products/{first['id']}")
+    client.get(f"/products/{second['id']}")
+    client.get("/products/999")
+    client.get("/no-such-page")
+
+    samples = scrape(client)
+    route = {"method": "GET", "route": "/products/{product_id}"}
+    assert sample(samples, "http_requests_total", status=200, **route) == 2
+    assert sample(samples, "http_requests_total", status=404, **route) == 1
+    assert sample(samples, "http_requests_total", method="GET", route="unmatched", status=404) == 1
+    assert sample(samples, "http_requests_total", method="POST", route="/products/", status=200) == 2
+    # Raw paths never become labels.
+    assert not any(dict(labels).get("route", "").startswith("/products/1") for _, labels in samples)
+
+    assert sample(samples, "http_request_duration_seconds_count", **route) == 3
+    assert sample(samples, "http_request_duration_seconds_bucket", le="+Inf", **route) == 3
+    buckets = [value for (name, labels), value in samples.items()
+               if name == "http_request_duration_seconds_bucket" and dict(labels)["route"] == route["route"]]
+    assert buckets == sorted(buckets)  # cumulative
+    for q in (0.5, 0.95, 0.99):
+        assert sample(samples, "http_request_duration_quantile_seconds", quantile=q, **route) >= 0
+    assert sample(samples, "db_queries_total", **route) >= 3
+
+
+def test_runtime_gauges(client, make_product):
+    product = make_product()
+    client.get(f"/products/{product['id']}")
+    client.get(f"/products/{product['id']}")
+    samples = scrape(client)
+    assert sample(samples, "product_cache_entries") == 1
+    assert sample(samples, "product_cache_events_total", event="hits") == 1
+    assert sample(samples, "changefeed_last_event_id") == 1
+    assert ("log_records_dropped_total", frozenset()) in samples
+
+
+def test_n_plus_one_is_flagged(client):
+    import metrics
+    from config import N_PLUS_ONE_THRESHOLD
+
+    stats = metrics.RequestStats()
+    stats.queries = N_PLUS_ONE_THRESHOLD
+    stats.statements = {"SELECT * FROM products WHERE id = ?": N_PLUS_ONE_THRESHOLD}
+    metrics.record_request("GET", "/loop", 200, 0.01, stats)
+    metrics.record_request("GET", "/loop", 200, 0.01, metrics.RequestStats())
+    assert sample(scrape(client), "db_n_plus_one_total", method="GET", route="/loop") == 1
+
+
+@pytest.mark.parametrize("value, rendered", [
+    ('say "hi"', 'say \\"hi\\"'),
+    ("a\\b", "a\\\\b"),
+    ("two\nlines", "two\\nlines"),
+])
+def test_label_values_are_escaped(app, value, rendered):
+    import metrics
+
+    assert metrics._sample("m", {"label": value}, 1) == f'm{{label="{rendered}"}} 1'
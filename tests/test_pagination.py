@@ -0,0 +1,79 @@
+import pytest
+
+
+def walk(client, **params):
+    """Every product returned by following X-Next-Cursor from the first page."""
+    products, cursor = [], None
+    while True:
+        response = client.get("/products/", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        products += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return products
+
+
+def test_cursor_walks_every_product_once(client, make_product):
+    ids = [make_product(price=float(price))["id"] for price in (5, 3, 9, 3, 1, 7, 5)]
+    assert [product["id"] for product in walk(client, limit=3)] == sorted(ids)
+
+
+def test_cursor_follows_sort_order_with_ties(client, make_product):
+    for price in (5, 3, 9, 3, 1, 7, 5):
+        make_product(price=float(price))
+    products = walk(client, limit=2, sort="-price")
+    assert [product["price"] for product in products] == [9, 7, 5, 5, 3, 3, 1]
+    # Ties are broken by id, in the same direction as the sort.
+    assert products[2]["id"] > products[3]["id"]
+
+
+def test_cursor_applies_filters(client, make_product):
+    for vendor in ("Acme", "Globex", "Acme", "Acme"):
+        make_product(vendor=vendor)
+    products = walk(client, limit=2, vendor="Acme")
+    assert [product["vendor"] for product in products] == ["Acme"] * 3
+
+
+def test_sparse_fields(client, make_product):
+    make_product(title="Lamp")
+    assert client.get("/products/", params={"fields": "title"}).json() == [{"id": 1, "title": "Lamp"}]
+    assert client.get("/products/", params={"fields": "nope"}).status_code == 400
+
+
+def test_invalid_cursor(client, make_product):
+    make_product()
+    make_product()
+    assert client.get("/products/", params={"cursor": "garbage"}).status_code == 400
+    # Cursors are only valid for the sort they were made for.
+    cursor = client.get("/products/", params={"limit": 1, "sort": "price"}).headers["X-Next-Cursor"]
+    assert client.get("/products/", params={"cursor": cursor, "sort": "title"}).status_code == 400
+
+
+@pytest.mark.parametrize("sort, value, last_id", [
+    ("price", "cheap", 1),
+    ("price", True, 1),
+    ("price", [1], 1),
+    ("title", 5, 1),
+    ("status", {"a": 1}, 1),
+    ("title", "Lamp", True),
+    ("title", "Lamp", "1"),
+    ("id", "1", 1),
+])
+def test_cursor_values_must_match_the_column(client, make_product, sort, value, last_id):
+    import pagination
+
+    make_product()
+    cursor = pagination.encode_cursor(sort, value, last_id)
+    assert client.get("/products/", params={"cursor": cursor, "sort": sort}).status_code == 400
+
+
+@pytest.mark.parametrize("limit", [0, -1, 1001])
+def test_limit_is_bounded(client, limit):
+    assert client.get("/products/", params={"limit": limit}).status_code == 422
+
+
+def test_empty_catalog(client):
+    response = client.get("/products/", params={"limit": 5})
+    assert response.status_code == 200
+    assert response.json() == []
+    assert "X-Next-Cursor" not in response.headers
@@ -0,0 +1,156 @@
+import pytest
+
+
+def test_create_read_update_delete(client, auth, make_product):
+    product = make_product(title="Lamp", price=25.0, cost_per_item=10.0, vendor="Acme")
+    assert product["version"] == 1
+    # profit and margin are computed by the server.
+    assert product["profit"] == pytest.approx(15.0)
+    assert product["margin"] == pytest.approx(60.0)
+
+    response = client.get(f"/products/{product['id']}")
+    assert response.status_code == 200
+    assert response.json()["title"] == "Lamp"
+
+    response = client.put(f"/products/{product['id']}", data={"price": "50"}, headers=auth)
+    assert response.status_code == 200
+    updated = response.json()
+    assert (updated["title"], updated["price"], updated["version"]) == ("Lamp", 50.0, 2)
+    assert updated["margin"] == pytest.approx(80.0)
+
+    assert client.delete(f"/products/{product['id']}", headers=auth).status_code == 200
+    assert client.get(f"/products/{product['id']}").status_code == 404
+    assert client.delete(f"/products/{product['id']}", headers=auth).status_code == 404
+
+
+def test_put_missing_product(client, auth):
+    assert client.put("/products/999", data={"title": "Nope"}, headers=auth).status_code == 404
+
+
+def test_patch_writes_only_given_fields(client, auth, make_product):
+    product = make_product(title="Lamp", vendor="Acme")
+    response = client.patch(f"/products/{product['id']}", json={"vendor": "Globex"}, headers=auth)
+    assert response.status_code == 200
+    patched = response.json()
+    assert (patched["title"], patched["vendor"], patched["version"]) == ("Lamp", "Globex", 2)
+    assert response.headers["ETag"] == f'"{product["id"]}-2"'
+
+
+@pytest.mark.parametrize("field", ["title", "description", "price"])
+def test_patch_rejects_null_for_required_fields(client, auth, make_product, field):
+    product = make_product()
+    response = client.patch(f"/products/{product['id']}", json={field: None}, headers=auth)
+    assert response.status_code == 422
+    response = client.patch("/products/", json={"updates": [{"id": product["id"], field: None}]}, headers=auth)
+    assert response.status_code == 422
+    assert client.get(f"/products/{product['id']}").json()["version"] == 1
+
+
+def test_patch_ignores_image_url(client, auth, make_product):
+    product = make_product()
+    response = client.patch(f"/products/{product['id']}", json={"image_url": "/images/elsewhere.png"}, headers=auth)
+    assert response.status_code == 200
+    assert response.json()["image_url"] is None
+
+
+def test_patch_if_match(client, auth, make_product):
+    product = make_product()
+    url = f"/products/{product['id']}"
+    etag = client.get(url).headers["ETag"]
+
+    response = client.patch(url, json={"title": "First"}, headers={**auth, "If-Match": etag})
+    assert response.status_code == 200
+    # The ETag used above is now stale.
+    response = client.patch(url, json={"title": "Second"}, headers={**auth, "If-Match": etag})
+    assert response.status_code == 412
+    response = client.patch(url, json={"title": "Second"}, headers={**auth, "If-Match": 'W/"weak"'})
+    assert response.status_code == 412
+
+    response = client.patch(url, json={"title": "Second"}, headers={**auth, "If-Match": "*"})
+    assert response.status_code == 200
+    assert client.get(url).json()["title"] == "Second"
+
+
+def test_patch_body_version(client, auth, make_product):
+    product = make_product()
+    url = f"/products/{product['id']}"
+    assert client.patch(url, json={"title": "New", "version": 1}, headers=auth).status_code == 200
+    assert client.patch(url, json={"title": "Newer", "version": 1}, headers=auth).status_code == 409
+    response = client.patch(url, json={"title": "Newer", "version": 1}, headers={**auth, "If-Match": f'"{product["id"]}-2"'})
+    assert response.status_code == 400
+
+
+def test_batch_patch(client, auth, make_product):
+    first, second = make_product(price=1.0), make_product(price=2.0)
+    response = client.patch("/products/", json={"updates": [
+        {"id": first["id"], "price": 5.0},
+        {"id": second["id"], "price": 6.0, "version": 7},
+        {"id": 999, "price": 7.0},
+    ]}, headers=auth)
+    assert response.status_code == 200
+    result = response.json()
+    assert [(product["id"], product["price"]) for product in result["updated"]] == [(first["id"], 5.0)]
+    assert sorted(result["skipped"]) == [second["id"], 999]
+
+    response = client.patch("/products/", json={"updates": [{"id": first["id"]}, {"id": first["id"]}]}, headers=auth)
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def statements(app):
+    """SQL statements sent to the database while the test runs."""
+    import database
+    from sqlalchemy import event
+
+    engine = database.async_engine.sync_engine if database.async_engine is not None else database.engine
+    sent = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sent.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield sent
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def test_patches_are_one_statement(client, auth, make_product, statements):
+    ids = [make_product()["id"] for _ in range(20)]
+    statements.clear()
+    response = client.patch("/products/", json={"updates": [{"id": i, "title": f"t{i}"} for i in ids]}, headers=auth)
+    assert response.status_code == 200
+    assert len(response.json()["updated"]) == 20
+    assert [statement.split()[0] for statement in statements] == ["UPDATE"]
+
+    statements.clear()
+    response = client.patch(f"/products/{ids[0]}", json={"title": "one"}, headers=auth)
+    assert response.json()["title"] == "one"
+    assert [statement.split()[0] for statement in statements] == ["UPDATE"]
+
+
+def test_delete_after_concurrent_write_is_a_conflict(client, auth, make_product, session):
+    import crud
+    import database
+    import models
+    from sqlalchemy import event, update
+
+    product = make_product(title="Lamp")
+    engine = database.async_engine.sync_engine if database.async_engine is not None else database.engine
+    written = []
+
+    def write_in_between(conn, cursor, statement, parameters, context, executemany):
+        # Another request updates the product after DELETE loaded it.
+        if statement.startswith("DELETE FROM product_facets") and not written:
+            written.append(statement)
+            with database.engine.begin() as other:
+                other.execute(update(models.Product).where(models.Product.id == product["id"])
+                              .values(title="Changed", version=models.Product.version + 1))
+
+    event.listen(engine, "before_cursor_execute", write_in_between)
+    try:
+        response = client.delete(f"/products/{product['id']}", headers=auth)
+    finally:
+        event.remove(engine, "before_cursor_execute", write_in_between)
+    assert written
+    assert response.status_code == 409
+    assert client.get(f"/products/{product['id']}").json()["title"] == "Changed"
+    assert crud.check_product_summary(session) == []
@@ -0,0 +1,47 @@
+def search(client, q, **params):
+    response = client.get("/products/search", params={"q": q, **params})
+    assert response.status_code == 200
+    return [product["title"] for product in response.json()]
+
+
+def test_ranking(client, make_product):
+    make_product(title="Desk", description="Goes well with a lamp")
+    make_product(title="Lamp", description="A lamp")
+    make_product(title="Shade", tags="lamp")
+    # Title (and SKU) outweigh tags, which outweigh the description.
+    assert search(client, "lamp") == ["Lamp", "Shade", "Desk"]
+    assert search(client, "lamp", limit=1) == ["Lamp"]
+
+
+def test_prefix_matching(client, make_product):
+    make_product(title="Wireless mouse")
+    make_product(title="Wired mouse")
+    make_product(title="Mousepad")
+    # Every term must match; each may be the start of a word.
+    assert sorted(search(client, "wire mou")) == ["Wired mouse", "Wireless mouse"]
+    # A whole word ranks above longer words starting with it.
+    assert search(client, "mouse")[-1] == "Mousepad"
+    assert search(client, "keyboard") == []
+    assert search(client, "!!") == []
+    assert client.get("/products/search", params={"q": ""}).status_code == 422
+
+
+def test_index_follows_writes(client, auth, make_product):
+    lamp = make_product(title="Lamp")
+    assert search(client, "lamp") == ["Lamp"]  # builds the index
+
+    desk = make_product(title="Desk lamp")
+    assert sorted(search(client, "lamp")) == ["Desk lamp", "Lamp"]
+
+    client.patch(f"/products/{lamp['id']}", json={"title": "Chair"}, headers=auth).raise_for_status()
+    assert search(client, "lamp") == ["Desk lamp"]
+    assert search(client, "chair") == ["Chair"]
+
+    client.patch("/products/", json={"updates": [{"id": desk["id"], "title": "Table"}]}, headers=auth)
+    client.put(f"/products/{lamp['id']}", data={"title": "Stool"}, headers=auth)
+    assert search(client, "lamp") == []
+    assert search(client, "table") == ["Table"]
+    assert search(client, "stool") == ["Stool"]
+
+    client.delete(f"/products/{desk['id']}", headers=auth)
+    assert search(client, "table") == []
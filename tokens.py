@@ -0,0 +1,163 @@
+# tokens.py
+# Signed JWT access and refresh tokens. Verification is local: a signature
+# check against an in-memory key ring plus a revocation lookup, with no
+# database query and no password hashing. The revocation list is per
+# process; refresh tokens are additionally claimed in the database when
+# they are used or logged out, so those are revoked on every worker.
+import logging
+import secrets
+import threading
+import time
+import uuid
+from typing import Dict
+
+import jwt
+
+from config import (
+    ACCESS_TOKEN_TTL, JWT_ALGORITHM, JWT_ISSUER, JWT_KEYS, JWT_SECRET, REFRESH_TOKEN_TTL,
+    TOKEN_REVOCATION_LIMIT,
+)
+
+logger = logging.getLogger(__name__)
+
+ACCESS = "access"
+REFRESH = "refresh"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class KeyRing:
+    """Signing keys by kid. New tokens use ``signing_kid``; all verify."""
+
+    def __init__(self, keys: Dict[str, str], signing_kid: str):
+        if signing_kid not in keys:
+            raise ValueError(f"Unknown signing key {signing_kid!r}")
+        self.keys = dict(keys)
+        self.signing_kid = signing_kid
+
+    @classmethod
+    def from_config(cls) -> "KeyRing":
+        keys = {}
+        for entry in filter(None, (part.strip() for part in JWT_KEYS.split(","))):
+            kid, sep, secret = entry.partition("=")
+            if not sep or not kid or not secret:
+                raise ValueError("JWT_KEYS must look like 'kid=secret,kid=secret'")
+            keys[kid.strip()] = secret.strip()
+        if not keys and JWT_SECRET:
+            keys["default"] = JWT_SECRET
+        if not keys:
+            logger.warning("JWT_KEYS is not set; using a random per-process signing key")
+            keys["ephemeral"] = secrets.token_urlsafe(32)
+        return cls(keys, next(iter(keys)))
+
+    def rotate(self, kid: str, secret: str) -> None:
+        """Sign with a new key from now on; the previous ones still verify."""
+        self.keys[kid] = secret
+        self.signing_kid = kid
+
+    def retire(self, kid: str) -> None:
+        """Stop accepting tokens signed with ``kid``."""
+        if kid == self.signing_kid:
+            raise ValueError("Cannot retire the active signing key")
+        self.keys.pop(kid, None)
+
+
+class RevocationList:
+    """Revoked token ids, each kept only until the token would expire anyway."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._expiry: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def revoke(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            if len(self._expiry) >= self.limit:
+                self._prune(time.time())
+            if len(self._expiry) >= self.limit:
+                # Still full of live entries: forget the one expiring first.
+                del self._expiry[min(self._expiry, key=self._expiry.get)]
+            self._expiry[jti] = expires_at
+
+    def is_revoked(self, jti: str) -> bool:
+        expires_at = self._expiry.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def _prune(self, now: float) -> None:
+        for jti in [jti for jti, expires_at in self._expiry.items() if expires_at <= now]:
+            del self._expiry[jti]
+
+    def __len__(self):
+        return len(self._expiry)
+
+
+key_ring = KeyRing.from_config()
+revoked = RevocationList(TOKEN_REVOCATION_LIMIT)
+
+
+def _encode(user_id: int, kind: str, ttl: int) -> str:
+    now = int(time.time())
+    claims = {
+        "sub": str(user_id),
+        "typ": kind,
+        "iss": JWT_ISSUER,
+        "iat": now,
+        "exp": now + ttl,
+        "jti": uuid.uuid4().hex,
+    }
+    kid = key_ring.signing_kid
+    return jwt.encode(claims, key_ring.keys[kid], algorithm=JWT_ALGORITHM, headers={"kid": kid})
+
+
+def issue_tokens(user_id: int) -> dict:
+    return {
+        "access_token": _encode(user_id, ACCESS, ACCESS_TOKEN_TTL),
+        "refresh_token": _encode(user_id, REFRESH, REFRESH_TOKEN_TTL),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_TTL,
+    }
+
+
+def decode(token: str, kind: str = ACCESS) -> dict:
+    """Verify ``token`` and return its claims; raises InvalidToken."""
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = key_ring.keys.get(kid)
+        if key is None:
+            raise InvalidToken("Unknown signing key")
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[JWT_ALGORITHM],
+            issuer=JWT_ISSUER,
+            options={"require": ["sub", "exp", "iat", "jti", "typ"]},
+        )
+    except jwt.ExpiredSignatureError:
+        raise InvalidToken("Token expired")
+    except jwt.PyJWTError:
+        raise InvalidToken("Invalid token")
+    if claims["typ"] != kind:
+        raise InvalidToken(f"Not an {kind} token" if kind == ACCESS else f"Not a {kind} token")
+    if revoked.is_revoked(claims["jti"]):
+        raise InvalidToken("Token revoked")
+    return claims
+
+
+def revoke(claims: dict) -> None:
+    revoked.revoke(claims["jti"], claims["exp"])
+
+
+def refresh(claims: dict) -> dict:
+    """Swap a decoded refresh token for a new pair; the old one is revoked.
+
+    Callers claim the token in the database first
+    (crud.revoke_refresh_token) so it cannot be reused on another worker.
+    """
+    revoke(claims)
+    return issue_tokens(int(claims["sub"]))
+
+
+def user_id(claims: dict) -> int:
+    return int(claims["sub"])